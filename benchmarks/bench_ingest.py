@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.generator import generate_database
+from smarthouse.persistence import SmartHouseRepository
+
+
+def bench_ingest(devices, rows, batch_size=None):
+    """
+    Ingests `rows` synthetic readings through `ingest_measurements` into a fresh
+    database, updating the in-memory house as well, and returns rows per second.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        file = generate_database(Path(tmp) / "bench.sql", devices=devices, measurements=0)
+        repo = SmartHouseRepository(str(file))
+        house = repo.load_smarthouse_deep()
+        sensors = [d.id for d in house.get_devices() if d.is_sensor()]
+        start_ts = datetime(2024, 6, 1)
+        readings = [(sensors[i % len(sensors)], (start_ts + timedelta(seconds=i // len(sensors))).strftime("%Y-%m-%d %H:%M:%S"),
+                     20.0 + i % 10, "°C") for i in range(rows)]
+
+        start = time.perf_counter()
+        stored = repo.ingest_measurements(readings, house=house, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+
+        assert stored == rows
+        repo.conn.close()
+    return rows / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measures the throughput of SmartHouseRepository.ingest_measurements.")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--batch-size", type=int, default=None)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        rate = bench_ingest(args.devices, rows, args.batch_size)
+        print(f"rows={rows:>10} {rate:,.0f} rows/s")
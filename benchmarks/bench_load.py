@@ -0,0 +1,45 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.generator import generate_database
+from smarthouse.persistence import SmartHouseRepository
+
+
+def bench_load(devices, measurements, repeat=3, lazy=False):
+    """
+    Generates a synthetic database of the given size and returns the best
+    wall clock time (in seconds) of `load_smarthouse_deep` over `repeat` runs.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        file = generate_database(Path(tmp) / "bench.sql", devices=devices, measurements=measurements)
+        repo = SmartHouseRepository(str(file))
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            house = repo.load_smarthouse_deep(lazy=lazy)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        assert len(house.get_devices()) == devices
+        del house
+        repo.conn.close()
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Times load_smarthouse_deep on synthetic databases.")
+    parser.add_argument("--devices", type=int, nargs="+", default=[10000])
+    parser.add_argument("--measurements", type=int, nargs="+", default=[100000, 1000000, 10000000])
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--lazy", action="store_true", help="load with lazy measurement histories")
+    args = parser.parse_args()
+
+    for devices in args.devices:
+        for measurements in args.measurements:
+            best = bench_load(devices, measurements, args.repeat, args.lazy)
+            print(f"devices={devices:>8} measurements={measurements:>10} load={best:8.3f}s "
+                  f"({measurements / best:,.0f} rows/s)")
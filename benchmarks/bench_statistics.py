@@ -0,0 +1,47 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import tempfile
+import time
+
+from benchmarks.generator import generate_database
+from smarthouse.analytics import HouseStatistics
+from smarthouse.persistence import SmartHouseRepository
+
+
+def bench_statistics(devices, measurements, date="2024-01-02"):
+    """
+    Computes daily temperature averages and humidity hours for every room,
+    once through the SQL methods of the repository and once through
+    `HouseStatistics`, and returns both wall clock times in seconds.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        file = generate_database(Path(tmp) / "bench.sql", devices=devices, measurements=measurements)
+        repo = SmartHouseRepository(str(file))
+        rooms = repo.load_smarthouse_deep(lazy=True).get_rooms()
+
+        start = time.perf_counter()
+        sql = [(repo.calc_avg_temperatures_in_room(room), repo.calc_hours_with_humidity_above(room, date)) for room in rooms]
+        sql_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        stats = HouseStatistics(repo)
+        mem = [(stats.calc_avg_temperatures_in_room(room), stats.calc_hours_with_humidity_above(room, date)) for room in rooms]
+        stats_time = time.perf_counter() - start
+
+        assert [hours for _, hours in sql] == [hours for _, hours in mem]
+        repo.conn.close()
+    return sql_time, stats_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compares the SQL statistics with HouseStatistics.")
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--measurements", type=int, nargs="+", default=[100000, 1000000])
+    args = parser.parse_args()
+
+    for measurements in args.measurements:
+        sql_time, stats_time = bench_statistics(args.devices, measurements)
+        print(f"measurements={measurements:>10} sql={sql_time:8.3f}s statistics={stats_time:8.3f}s")
@@ -0,0 +1,115 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import random
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+
+# Same schema as data/db.sql
+SCHEMA = """
+CREATE TABLE rooms(
+	id INT NOT NULL,
+	floor INT NOT NULL,
+	area REAL NOT NULL,
+	name TEXT NULL,
+	PRIMARY KEY (id)
+);
+CREATE TABLE devices(
+	id TEXT NOT NULL,
+	room INT NOT NULL,
+	kind TEXT NOT NULL,
+	category TEXT NOT NULL,
+	supplier TEXT NULL,
+	product TEXT NULL,
+	PRIMARY KEY (id),
+	FOREIGN KEY (room) REFERENCES rooms(id)
+);
+CREATE TABLE measurements(
+	device text not null,
+	ts text not null,
+	value float not null,
+	unit text null,
+	foreign key (device) references  devices(id)
+);
+CREATE TABLE ActuatorState (
+	id TEXT NOT NULL, state INTEGER DEFAULT (0) NOT NULL,
+	CONSTRAINT ActuatorState_PK PRIMARY KEY (id),
+	CONSTRAINT ActuatorState_devices_FK FOREIGN KEY (id) REFERENCES devices(id)
+);
+"""
+
+# (kind, category, unit, typical value, spread)
+DEVICE_KINDS = [
+    ("Temperature Sensor", "sensor", "°C", 21.0, 3.0),
+    ("Humidity Sensor", "sensor", "%", 50.0, 15.0),
+    ("Electricity Meter", "sensor", "kWh", 12.0, 4.0),
+    ("CO2 sensor", "sensor", "ppm", 600.0, 150.0),
+    ("Heat Pump", "actuator", "°C", 22.0, 2.0),
+    ("Light Bulp", "actuator", None, 0.0, 0.0),
+    ("Smart Plug", "actuator", None, 0.0, 0.0),
+]
+
+START = datetime(2024, 1, 1)
+
+
+def generate_database(file, devices=100, measurements=10000, floors=2, rooms_per_floor=6, seed=301, batch_size=50000,
+                      days=None, interval=60):
+    """
+    Creates a synthetic smarthouse database with the given number of devices
+    and measurements. The measurements are spread round robin over all devices
+    that report a unit, one reading per device every `interval` seconds starting
+    2024-01-01. If `days` is given, every reporting device gets readings for that
+    many days (e.g. 365 for a year) and `measurements` is ignored.
+    The same arguments always produce the same database.
+    """
+    path = Path(file)
+    for stale in (path, Path(str(path) + "-wal"), Path(str(path) + "-shm")):
+        if stale.exists():
+            stale.unlink()
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(str(path))
+    conn.executescript(SCHEMA)
+
+    room_ids = []
+    for floor in range(1, floors + 1):
+        for i in range(rooms_per_floor):
+            room_id = len(room_ids) + 1
+            room_ids.append(room_id)
+            conn.execute("INSERT INTO rooms VALUES (?, ?, ?, ?)",
+                         (room_id, floor, round(rnd.uniform(4, 40), 2), f"Room {floor}.{i + 1}"))
+
+    reporting = []
+    for i in range(devices):
+        kind, category, unit, mean, spread = DEVICE_KINDS[i % len(DEVICE_KINDS)]
+        device_id = str(uuid.UUID(int=rnd.getrandbits(128), version=4))
+        conn.execute("INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?)",
+                     (device_id, rnd.choice(room_ids), kind, category, "Synthetic Inc.", f"{kind} {i}"))
+        if category == "actuator":
+            conn.execute("INSERT INTO ActuatorState VALUES (?, ?)", (device_id, 0))
+        if unit is not None:
+            reporting.append((device_id, unit, mean, spread))
+
+    if days is not None:
+        measurements = int(days * 86400 // interval) * len(reporting)
+
+    def rows():
+        if not reporting:
+            return
+        for n in range(measurements):
+            device_id, unit, mean, spread = reporting[n % len(reporting)]
+            ts = START + timedelta(seconds=interval * (n // len(reporting)))
+            yield (device_id, ts.strftime("%Y-%m-%d %H:%M:%S"), round(rnd.gauss(mean, spread), 2), unit)
+
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) >= batch_size:
+            conn.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO measurements VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+    return path
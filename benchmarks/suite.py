@@ -0,0 +1,207 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from benchmarks.generator import generate_database
+from smarthouse.persistence import SmartHouseRepository
+
+
+def timed(fn, repeat=5, number=1):
+    """
+    Runs `fn` `number` times per round for `repeat` rounds and returns the
+    per-call wall clock times (in seconds) of every round.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+def result(name, times, number=1, **extra):
+    return {
+        "name": name,
+        "unit": "s",
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "rounds": len(times),
+        "number": number,
+        **extra,
+    }
+
+
+def repository_scenarios(file, repeat):
+    """
+    Times the repository and domain operations on the given database.
+    """
+    results = []
+    repo = SmartHouseRepository(str(file))
+    house = repo.load_smarthouse_deep()
+    rows = sum(len(device.measurement_history) for device in house.get_devices())
+
+    results.append(result("load_smarthouse_deep", timed(repo.load_smarthouse_deep, repeat), rows=rows))
+    results.append(result("load_smarthouse_deep_lazy", timed(lambda: repo.load_smarthouse_deep(lazy=True), repeat)))
+    repo.load_smarthouse_cached()
+    results.append(result("load_smarthouse_cached", timed(repo.load_smarthouse_cached, repeat), rows=rows))
+
+    ids = [device.id for device in house.get_devices()]
+    lookups = 100000
+    def lookup():
+        get = house.get_device_by_id
+        for i in range(lookups):
+            get(ids[i % len(ids)])
+    results.append(result("get_device_by_id", [t / lookups for t in timed(lookup, repeat)], number=lookups))
+
+    rooms = house.get_rooms()
+    day = "2024-01-01"
+    results.append(result("calc_avg_temperatures_in_room",
+                          [t / len(rooms) for t in timed(lambda: [repo.calc_avg_temperatures_in_room(room) for room in rooms], repeat)],
+                          number=len(rooms)))
+    results.append(result("calc_hours_with_humidity_above",
+                          [t / len(rooms) for t in timed(lambda: [repo.calc_hours_with_humidity_above(room, day) for room in rooms], repeat)],
+                          number=len(rooms)))
+
+    actuators = [device for device in house.get_devices() if device.is_actuator()]
+    if actuators:
+        def toggle():
+            actuator = actuators[0]
+            actuator.turn_off() if actuator.is_active() else actuator.turn_on()
+            repo.update_actuator_state(actuator)
+        results.append(result("update_actuator_state", timed(toggle, repeat, number=10), number=10))
+        results.append(result("update_actuator_states", timed(lambda: repo.update_actuator_states(actuators), repeat),
+                              actuators=len(actuators)))
+    repo.pool.close()
+    return results
+
+
+def api_scenarios(file, repeat):
+    """
+    Times every endpoint of the API through the ASGI test client, with the API
+    pointed to the given database. Skipped if FastAPI is not installed.
+    """
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        return []
+    os.environ["SMARTHOUSE_DB"] = str(file)
+    from smarthouse import api
+
+    house = api.smarthouse
+    sensor = next(device for device in house.get_devices() if device.is_sensor() and device.measurement_history)
+    actuator = next(device for device in house.get_devices() if device.is_actuator())
+    floor = house.get_floors()[0]
+    room = floor.rooms[0]
+    requests = [
+        ("GET", "/smarthouse", None),
+        ("GET", "/smarthouse/floor", None),
+        ("GET", f"/smarthouse/floor/{floor.level}", None),
+        ("GET", f"/smarthouse/floor/{floor.level}/room", None),
+        ("GET", f"/smarthouse/floor/{floor.level}/room/{room.room_id}", None),
+        ("GET", f"/smarthouse/device/{sensor.id}", None),
+        ("GET", f"/smarthouse/sensor/{sensor.id}/current", None),
+        ("GET", f"/smarthouse/sensor/{sensor.id}/values?limit=1000", None),
+        ("GET", f"/smarthouse/sensor/{sensor.id}/values?every=3600&limit=1000", None),
+        ("GET", f"/smarthouse/sensor/{sensor.id}/values?points=500", None),
+        ("GET", f"/smarthouse/export/measurements?device={sensor.id}", None),
+        ("GET", f"/smarthouse/actuator/{actuator.id}/current", None),
+        ("PUT", f"/smarthouse/actuator/{actuator.id}/current", {"state": True}),
+        ("PUT", "/smarthouse/actuator", {"states": {actuator.id: False}}),
+        ("POST", f"/smarthouse/sensor/{sensor.id}/current", {"value": 21.5, "unit": "°C"}),
+        ("GET", "/smarthouse/ingest/metrics", None),
+        ("GET", "/smarthouse/events/metrics", None),
+    ]
+    results = []
+    with TestClient(api.app) as client:
+        for method, url, body in requests:
+            def call():
+                response = client.request(method, url, json=body)
+                assert response.status_code < 400, (url, response.status_code)
+            call()
+            results.append(result(f"api {method} {url.replace(sensor.id, '{sensor}').replace(actuator.id, '{actuator}')}",
+                                  timed(call, repeat, number=10), number=10))
+    return results
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "parameters": vars(args),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the medians with a previous result file and returns the
+    scenarios that got slower by more than `tolerance` (0.2 = 20%).
+    """
+    previous = {entry["name"]: entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        before = previous.get(entry["name"])
+        if before and entry["median"] > before["median"] * (1 + tolerance):
+            regressions.append((entry["name"], before["median"], entry["median"]))
+    return regressions
+
+
+def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        file = generate_database(Path(tmp) / "bench.sql", devices=args.devices, floors=args.floors,
+                                 rooms_per_floor=args.rooms_per_floor, days=args.days, interval=args.interval, seed=args.seed)
+        results = repository_scenarios(file, args.repeat)
+        if not args.no_api:
+            results += api_scenarios(file, args.repeat)
+    return {"meta": metadata(args), "results": results}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Runs the benchmark scenarios on a generated database and writes the results as JSON.")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--floors", type=int, default=2)
+    parser.add_argument("--rooms-per-floor", type=int, default=6)
+    parser.add_argument("--days", type=float, default=7, help="days of readings per device")
+    parser.add_argument("--interval", type=int, default=60, help="seconds between two readings of a device")
+    parser.add_argument("--seed", type=int, default=301)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-api", action="store_true", help="skip the API endpoints")
+    parser.add_argument("--output", help="file for the JSON results, default stdout")
+    parser.add_argument("--baseline", help="earlier JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+    for entry in report["results"]:
+        print(f"{entry['name']:<70} {entry['median'] * 1000:10.3f} ms", file=sys.stderr)
+
+    if args.baseline:
+        regressions = compare(report["results"], json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,206 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional
+from smarthouse.domain import from_epoch, to_epoch
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_HOUR = 3600
+
+TEMPERATURE = "°C"
+HUMIDITY = "%"
+
+
+class RoomSeries:
+    """
+    All readings of one unit in one room, as parallel columns of epoch
+    seconds and values sorted by time.
+    """
+
+    __slots__ = ("room_id", "unit", "timestamps", "values")
+
+    def __init__(self, room_id, unit):
+        self.room_id = room_id
+        self.unit = unit
+        self.timestamps = array('q')
+        self.values = array('d')
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def between(self, start = None, end = None):
+        """
+        Returns the (timestamps, values) columns restricted to start <= ts <= end.
+        """
+        ts = self.timestamps
+        lo = 0 if start is None else bisect_left(ts, start)
+        hi = len(ts) if end is None else bisect_right(ts, end)
+        return ts[lo:hi], self.values[lo:hi]
+
+
+def load_series(conn, unit, room_id = None) -> dict:
+    """
+    Fetches the readings with the given unit for one room (or all rooms if
+    `room_id` is None) in a single query and returns a dict room id -> RoomSeries.
+    """
+    sql = """
+          SELECT d.room, CAST(strftime('%s', m.ts) AS INTEGER), m.value
+          FROM measurements m INNER JOIN devices d ON d.id = m.device
+          WHERE m.unit = ?
+          """
+    params = [unit]
+    if room_id is not None:
+        sql += " AND d.room = ?"
+        params.append(room_id)
+    sql += " ORDER BY d.room, m.ts"
+
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    result = {}
+    series = None
+    while True:
+        rows = cursor.fetchmany(10000)
+        if not rows:
+            break
+        for room, epoch, value in rows:
+            if series is None or series.room_id != room:
+                series = result[room] = RoomSeries(room, unit)
+            series.timestamps.append(epoch)
+            series.values.append(value)
+    cursor.close()
+    return result
+
+
+def _day_bounds(from_date, until_date):
+    start = None if from_date is None else to_epoch(from_date + " 00:00:00")
+    end = None if until_date is None else to_epoch(until_date + " 23:59:59")
+    return start, end
+
+
+def daily_means(series, from_date: Optional[str] = None, until_date: Optional[str] = None) -> dict:
+    """
+    Average value per day (iso date string -> float) within the given date range.
+    """
+    ts, values = series.between(*_day_bounds(from_date, until_date))
+    sums = {}
+    counts = {}
+    for t, v in zip(ts, values):
+        day = t // SECONDS_PER_DAY
+        sums[day] = sums.get(day, 0.0) + v
+        counts[day] = counts.get(day, 0) + 1
+    return {from_epoch(day * SECONDS_PER_DAY)[:10]: sums[day] / counts[day] for day in sorted(sums)}
+
+
+def hourly_counts_above(series, date: str, threshold: Optional[float] = None) -> list:
+    """
+    Number of readings per hour [0-23] of the given day that are at or above
+    `threshold`. Without a threshold the average of that day is used.
+    """
+    ts, values = series.between(*_day_bounds(date, date))
+    counts = [0] * 24
+    if not values:
+        return counts
+    if threshold is None:
+        threshold = sum(values) / len(values)
+    for t, v in zip(ts, values):
+        if v >= threshold:
+            counts[(t % SECONDS_PER_DAY) // SECONDS_PER_HOUR] += 1
+    return counts
+
+
+def hours_above(series, date: str, threshold: Optional[float] = None, min_count: int = 3) -> list:
+    """
+    Hours of the given day with more than `min_count` readings at or above the threshold.
+    """
+    return [hour for hour, count in enumerate(hourly_counts_above(series, date, threshold)) if count > min_count]
+
+
+def percentile(sorted_values, p):
+    """
+    Linear interpolated percentile (0-100) of an already sorted sequence.
+    """
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
+
+def summary(series, from_date: Optional[str] = None, until_date: Optional[str] = None, percentiles = (50, 90, 99)) -> dict:
+    """
+    Count, min, max, mean and the requested percentiles of the readings in the date range.
+    """
+    _, values = series.between(*_day_bounds(from_date, until_date))
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    result = {
+        "count": len(ordered),
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": sum(ordered) / len(ordered),
+    }
+    for p in percentiles:
+        result[f"p{p}"] = percentile(ordered, p)
+    return result
+
+
+def rolling_mean(series, window: int) -> list:
+    """
+    Mean over the last `window` readings for every reading, as a list of
+    (timestamp string, mean) pairs. Uses a running sum, so it is O(n).
+    """
+    ts, values = series.timestamps, series.values
+    result = []
+    total = 0.0
+    for i, v in enumerate(values):
+        total += v
+        if i >= window:
+            total -= values[i - window]
+        result.append((from_epoch(ts[i]), total / min(i + 1, window)))
+    return result
+
+
+class HouseStatistics:
+    """
+    Answers the statistics questions of `SmartHouseRepository` from series that
+    are fetched once for all rooms and kept in memory, instead of running
+    one SQL query per room and call.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.series = {}
+
+    def refresh(self):
+        self.series = {}
+
+    def unit_series(self, unit) -> dict:
+        if unit not in self.series:
+            with self.repo.pool.read_connection() as conn:
+                self.series[unit] = load_series(conn, unit)
+        return self.series[unit]
+
+    def room_series(self, room, unit):
+        room_id = self.repo.room_id(room)
+        series = self.unit_series(unit).get(room_id)
+        return series if series is not None else RoomSeries(room_id, unit)
+
+    def calc_avg_temperatures_in_room(self, room, from_date: Optional[str] = None, until_date: Optional[str] = None) -> dict:
+        return daily_means(self.room_series(room, TEMPERATURE), from_date, until_date)
+
+    def calc_hours_with_humidity_above(self, room, date: str) -> list:
+        return hours_above(self.room_series(room, HUMIDITY), date)
+
+    def daily_means_all_rooms(self, unit = TEMPERATURE, from_date: Optional[str] = None, until_date: Optional[str] = None) -> dict:
+        """
+        Daily means for every room in one pass: room id -> {date: mean}.
+        """
+        return {room_id: daily_means(series, from_date, until_date) for room_id, series in self.unit_series(unit).items()}
+
+    def summary_all_rooms(self, unit, from_date: Optional[str] = None, until_date: Optional[str] = None) -> dict:
+        return {room_id: summary(series, from_date, until_date) for room_id, series in self.unit_series(unit).items()}
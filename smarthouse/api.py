@@ -3,23 +3,85 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse, StreamingResponse
+from pydantic import BaseModel
 from smarthouse.persistence import SmartHouseRepository
+from smarthouse.async_persistence import AsyncSmartHouseRepository
+from smarthouse.ingest import IngestQueue
+from smarthouse.sync import HouseSync
+from smarthouse.response_cache import ResponseCache
+from smarthouse.hub import EventHub
+from smarthouse.coalesce import ActuatorStateCoalescer
+from smarthouse.export import ndjson_chunks, csv_chunks, gzip_chunks, encode_chunks
+from smarthouse.metrics import Metrics, MetricsMiddleware
+from smarthouse.houses import HouseRegistry
+from smarthouse.domain import to_epoch, from_epoch
 from pathlib import Path
+import asyncio
+import base64
+import json
 import os
 
 def setup_database():
     project_dir = Path(__file__).parent.parent
     db_file = project_dir / "data" / "db.sql" # you have to adjust this if you have changed the file name of the database
+    # SMARTHOUSE_DB peker på en annen database, f.eks. for benchmarks
+    db_file = Path(os.environ.get("SMARTHOUSE_DB", db_file))
     return SmartHouseRepository(str(db_file.absolute()))
 
-app = FastAPI()
-
 repo = setup_database()
 
-smarthouse = repo.load_smarthouse_deep()
+# måler tid per endepunkt og per SQL-setning, slås av med SMARTHOUSE_METRICS=0
+metrics = Metrics(enabled=os.environ.get("SMARTHOUSE_METRICS", "1") != "0")
+repo.trace(metrics)
+
+arepo = AsyncSmartHouseRepository(repo)
+
+# starter fra snapshotet ved siden av databasen hvis det er gyldig
+smarthouse = repo.load_smarthouse_cached(lazy=True)
+
+ingest_queue = IngestQueue(repo, smarthouse)
+
+# henter nye rom, enheter og tilstander fra databasen med jevne mellomrom
+house_sync = HouseSync(repo, smarthouse, lazy=True)
+
+# ferdig serialiserte svar for endepunktene som bare leser husets struktur
+response_cache = ResponseCache(smarthouse)
+
+# sender nye målinger og aktuatorendringer videre til klienter som lytter
+hub = EventHub(smarthouse)
+repo.add_listener(hub.publish)
+
+# raske av/på-endringer av samme aktuator blir til én skriving
+actuator_writer = ActuatorStateCoalescer(arepo)
+
+# flere hus, én database per hus i SMARTHOUSE_HOUSES (standard data/houses), lastes ved behov
+houses = HouseRegistry(os.environ.get("SMARTHOUSE_HOUSES", Path(__file__).parent.parent / "data" / "houses"),
+                       memory_budget=int(os.environ.get("SMARTHOUSE_HOUSES_MEMORY", 512 * 1024 * 1024)))
+
+@asynccontextmanager
+async def lifespan(app):
+    await hub.start()
+    await ingest_queue.start()
+    await house_sync.start()
+    yield
+    await house_sync.stop()
+    await actuator_writer.flush()
+    # skriver alle målinger som fortsatt ligger i køen før vi avslutter
+    await ingest_queue.stop()
+    arepo.close()
+    houses.close()
+    repo.save_snapshot(smarthouse)
+    # den siste forbindelsen som lukkes skriver WAL-filen inn i databasen, så alt er lagret på disk
+    repo.pool.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, metrics=metrics)
 
 if not (Path.cwd() / "www").exists():
     os.chdir(Path.cwd().parent)
@@ -30,88 +92,104 @@ if (Path.cwd() / "www").exists():
 
 # http://localhost:8000/ -> welcome page
 @app.get("/")
-def root():
+async def root():
     return RedirectResponse("/static/index.html")
 
 # Starting point ...
 
 @app.get("/smarthouse")
-def get_smarthouse_info() -> dict[str, int | float]:
+async def get_smarthouse_info(request: Request) -> dict[str, int | float]:
     """
     This endpoint returns an object that provides information
     about the general structure of the smarthouse.
     """
-    return {
-        "no_rooms": len(smarthouse.get_rooms()),
-        "no_floors": len(smarthouse.get_floors()),
-        "registered_devices": len(smarthouse.get_devices()),
-        "area": smarthouse.get_area()
-    }
+    def build():
+        return {
+            "no_rooms": smarthouse.get_room_count(),
+            "no_floors": len(smarthouse.get_floors()),
+            "registered_devices": smarthouse.get_device_count(),
+            "area": smarthouse.get_area()
+        }
+
+    return response_cache.respond(request, "smarthouse", build)
 
 @app.get("/smarthouse/floor")
-def get_all_floors():
+async def get_all_floors(request: Request):
     """
     This endpoint returns an object that provides information
     about the floors of the smarthouse.
     """
+    def build():
+        floors = smarthouse.get_floors()
 
-    floors = smarthouse.get_floors()
+        return [
+            {
+                "floor_number": floor.get_level(),
+                "floor_area": floor.get_area()
+            }
+            for floor in floors
+        ]
 
-    return [
-        {
-            "floor_number": floor.get_level().level,
-            "floor_area": floor.get_area()
-        }
-        for floor in floors
-    ]
+    return response_cache.respond(request, "floors", build)
 
 @app.get("/smarthouse/floor/{Level}")
-def get_floor(Level: int):
+async def get_floor(Level: int, request: Request):
     """
     This endpoint returns an object that provides information
     about the chosen floor of the smarthouse.
     """
-    
-    floors = smarthouse.get_floors()
+    # etasjer som ikke finnes caches ikke, ellers kan klienter fylle cachen med vilkårlige nøkler
+    if smarthouse.get_floor(Level) is None:
+        return []
 
-    return [
-        {
-            "floor_number": floor.get_level().level,
-            "floor_area": floor.get_area()
-        }
-        for floor in floors
-        if floor.get_level().level == Level
-    ]
+    def build():
+        floor = smarthouse.get_floor(Level)
+
+        return [
+            {
+                "floor_number": floor.get_level(),
+                "floor_area": floor.get_area()
+            }
+        ] if floor else []
+
+    return response_cache.respond(request, ("floor", Level), build)
 
 @app.get("/smarthouse/floor/{Level}/room")
-def get_floor(Level: int):
+async def get_floor(Level: int, request: Request):
     """
     This endpoint returns an object that provides information
     about the rooms on chosen floor of the smarthouse.
     """
-    
-    rooms = smarthouse.get_rooms()
+    if smarthouse.get_floor(Level) is None:
+        return []
 
-    return [
-        {
-            "name": room.room_name,
-            "area": room.area,
-            "floor": room.floor.get_level().level
-        }
-        for room in rooms
-        if room.floor.get_level().level == Level
-    ]
+    def build():
+        floor = smarthouse.get_floor(Level)
+        rooms = floor.rooms if floor else []
+
+        return [
+            {
+                "name": room.room_name,
+                "area": room.area,
+                "floor": room.floor.get_level()
+            }
+            for room in rooms
+        ]
+
+    return response_cache.respond(request, ("rooms", Level), build)
 
 @app.get("/smarthouse/floor/{Level}/room/{id}")
-def get_floor(Level: int, id: int):
+async def get_floor(Level: int, id: int):
     """
     This endpoint returns an object that provides information
     about a specified roomd on the chosen floor of the smarthouse.
     """
 
-    cursor = repo.cursor()
-    cursor.execute("SELECT id, floor, area, name FROM rooms WHERE id = ?", (id,))
-    room_data = cursor.fetchone()
+    def fetch_room(cursor):
+        cursor.execute("SELECT id, floor, area, name FROM rooms WHERE id = ?", (id,))
+        return cursor.fetchone()
+
+    room_data = await arepo.read(fetch_room)
 
     if not room_data:
         return {"error": "Room not found"}
@@ -127,5 +205,396 @@ def get_floor(Level: int, id: int):
         "floor": floor_level
     }
 
+def device_info(device):
+    info = {
+        "id": device.id,
+        "supplier": device.supplier,
+        "product": device.model_name,
+        "kind": device.device_type,
+        "category": "actuator" if device.is_actuator() else "sensor",
+        "room": device.room.room_id if device.room else None,
+    }
+    if device.is_actuator():
+        info["state"] = device.state
+    return info
+
+def measurement_info(measurement):
+    return {
+        "timestamp": str(measurement.timestamp),
+        "value": measurement.value,
+        "unit": measurement.unit
+    }
+
+def get_device_or_404(uuid):
+    device = smarthouse.get_device_by_id(uuid)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device
+
+def query_timestamp(value, end = False):
+    # godtar både datoer og tidspunkt, med eller uten "T"
+    if value is None:
+        return None
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid timestamp: {value}")
+    if len(value) == 10 and end:
+        timestamp = timestamp.replace(hour=23, minute=59, second=59)
+    return from_epoch(to_epoch(timestamp))
+
+# største tall SQLite kan lagre, og epoker som kan skrives som tidspunkt i databasens format
+INT64_RANGE = (-2 ** 63, 2 ** 63 - 1)
+EPOCH_RANGE = (to_epoch("0001-01-01 00:00:00"), to_epoch("9999-12-31 23:59:59"))
+# største bucket for `every`, ett år
+MAX_EVERY = 366 * 24 * 3600
+
+def is_int(value, low = INT64_RANGE[0], high = INT64_RANGE[1]):
+    return isinstance(value, int) and not isinstance(value, bool) and low <= value <= high
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/smarthouse/device/{uuid}")
+async def get_device(uuid: str):
+    """
+    This endpoint returns information about the given device.
+    """
+    return device_info(get_device_or_404(uuid))
+
+@app.get("/smarthouse/sensor/{uuid}/current")
+async def get_sensor_current(uuid: str):
+    """
+    This endpoint returns the latest reading of the given sensor.
+    """
+    measurement = await arepo.get_latest_reading(get_device_or_404(uuid))
+    if measurement is None:
+        raise HTTPException(status_code=404, detail="No readings available")
+    return measurement_info(measurement)
+
+@app.get("/smarthouse/sensor/{uuid}/values")
+async def get_sensor_values(uuid: str,
+                            from_: Optional[str] = Query(None, alias="from"),
+                            until: Optional[str] = None,
+                            limit: int = Query(100, ge=1, le=10000),
+                            cursor: Optional[str] = None,
+                            every: Optional[int] = Query(None, ge=1, le=MAX_EVERY),
+                            points: Optional[int] = Query(None, ge=3, le=10000),
+                            method: str = Query("lttb", pattern="^(lttb|minmax)$")):
+    """
+    This endpoint returns the readings of the given sensor between `from` and `until`
+    one page at a time, oldest first. The `next` value of the response is passed as
+    `cursor` to get the following page; it is null on the last page.
+    With `every` the readings are averaged into buckets of that many seconds.
+    With `points` the whole range is reduced to about that many readings for
+    plotting, using `method` lttb (default) or minmax, in a single response.
+    """
+    device = get_device_or_404(uuid)
+    start = query_timestamp(from_)
+    end = query_timestamp(until, end=True)
+    if points:
+        measurements = await arepo.downsample_measurements(device.id, points, start, end, method)
+        return {
+            "device": device.id,
+            "values": [measurement_info(m) for m in measurements],
+            "next": None
+        }
+    after = decode_cursor(cursor) if cursor else None
+    if after is not None and not (is_int(after, *EPOCH_RANGE) if every else
+                                  isinstance(after, list) and len(after) == 2 and isinstance(after[0], str) and is_int(after[1])):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if every and after is not None:
+        # bucketen etter markøren må kunne skrives som tidspunkt
+        try:
+            from_epoch(after + every)
+        except (OverflowError, OSError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    if every:
+        buckets, next_key = await arepo.get_measurement_buckets(device.id, every, start, end, limit, after)
+        values = [
+            {
+                "timestamp": timestamp,
+                "count": count,
+                "value": avg,
+                "min": low,
+                "max": high,
+                "unit": unit
+            }
+            for timestamp, count, avg, low, high, unit in buckets
+        ]
+    else:
+        measurements, next_key = await arepo.get_measurements(device.id, start, end, limit, tuple(after) if after else None)
+        values = [measurement_info(m) for m in measurements]
+    return {
+        "device": device.id,
+        "values": values,
+        "next": encode_cursor(next_key) if next_key is not None else None
+    }
+
+@app.get("/smarthouse/export/measurements")
+def export_measurements(format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+                        device: Optional[str] = None,
+                        from_: Optional[str] = Query(None, alias="from"),
+                        until: Optional[str] = None,
+                        gzip: bool = False):
+    """
+    This endpoint streams all stored readings, optionally of one device and
+    between `from` and `until`, as NDJSON or CSV. The rows are read and sent
+    in chunks, so the export runs in constant memory regardless of its size.
+    With `gzip=true` the stream is compressed.
+    """
+    if device is not None:
+        get_device_or_404(device)
+    rows = repo.export_measurements(device, query_timestamp(from_), query_timestamp(until, end=True))
+    if format == "csv":
+        chunks, media_type, extension = csv_chunks(rows), "text/csv", "csv"
+    else:
+        chunks, media_type, extension = ndjson_chunks(rows), "application/x-ndjson", "ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="measurements.{extension}{".gz" if gzip else ""}"'}
+    if gzip:
+        return StreamingResponse(gzip_chunks(chunks), media_type="application/gzip", headers=headers)
+    return StreamingResponse(encode_chunks(chunks), media_type=media_type, headers=headers)
+
+def event_stream(room_id = None, device_id = None):
+    subscription = hub.subscribe(room_id, device_id)
+    if subscription is None:
+        raise HTTPException(status_code=503, detail="Too many subscribers", headers={"Retry-After": "5"})
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                batch = await subscription.next()
+                if batch is None:
+                    break
+                if not batch:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield "".join(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n" for event in batch)
+        finally:
+            hub.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/smarthouse/events")
+async def get_house_events():
+    """
+    This endpoint streams new readings and actuator changes of the whole house
+    as server-sent events. Bursts are collapsed into the latest value per device.
+    """
+    return event_stream()
+
+@app.get("/smarthouse/room/{id}/events")
+async def get_room_events(id: int):
+    """
+    This endpoint streams new readings and actuator changes in the given room.
+    """
+    if smarthouse.get_room_by_id(id) is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return event_stream(room_id=id)
+
+@app.get("/smarthouse/device/{uuid}/events")
+async def get_device_events(uuid: str):
+    """
+    This endpoint streams new readings and state changes of the given device.
+    """
+    return event_stream(device_id=get_device_or_404(uuid).id)
+
+@app.get("/smarthouse/events/metrics")
+async def get_event_metrics():
+    """
+    This endpoint returns the number of live subscribers and delivered or dropped events.
+    """
+    return hub.metrics()
+
+# databasen lagrer bare av/på (se update_actuator_states), så nivåer som 0.5 avvises
+class ActuatorState(BaseModel):
+    state: bool
+
+class ActuatorStates(BaseModel):
+    states: dict[str, bool]
+
+def set_state(actuator, state):
+    if state:
+        actuator.turn_on()
+    else:
+        actuator.turn_off()
+
+def get_actuator_or_404(uuid):
+    device = get_device_or_404(uuid)
+    if not device.is_actuator():
+        raise HTTPException(status_code=400, detail="Device is not an actuator")
+    return device
+
+@app.get("/smarthouse/actuator/{uuid}/current")
+async def get_actuator_state(uuid: str):
+    """
+    This endpoint returns the current state of the given actuator.
+    """
+    return {"state": get_actuator_or_404(uuid).state}
+
+@app.put("/smarthouse/actuator/{uuid}/current")
+async def set_actuator_state(uuid: str, body: ActuatorState):
+    """
+    This endpoint turns the given actuator on or off and saves the new state;
+    subscribers of the event streams are notified.
+    """
+    actuator = get_actuator_or_404(uuid)
+    set_state(actuator, body.state)
+    await actuator_writer.submit(actuator)
+    return device_info(actuator)
+
+@app.put("/smarthouse/actuator")
+async def set_actuator_states(body: ActuatorStates):
+    """
+    This endpoint sets the states of many actuators at once, e.g. for a scene
+    like "turn off all lights", and saves them in a single transaction.
+    """
+    actuators = [get_actuator_or_404(uuid) for uuid in body.states]
+    for actuator in actuators:
+        set_state(actuator, body.states[actuator.id])
+    await arepo.update_actuator_states(actuators)
+    return [device_info(actuator) for actuator in actuators]
+
+@app.get("/smarthouse/actuator/metrics")
+async def get_actuator_metrics():
+    """
+    This endpoint returns how many actuator changes were submitted and how many writes they needed.
+    """
+    return actuator_writer.metrics()
+
+class Reading(BaseModel):
+    value: float
+    unit: Optional[str] = None
+    timestamp: Optional[datetime] = None
+
+@app.post("/smarthouse/sensor/{uuid}/current", status_code=202)
+async def add_sensor_reading(uuid: str, reading: Reading):
+    """
+    This endpoint accepts a new reading for the given device. Readings are
+    buffered and written to the database in batches, the response is sent
+    as soon as the reading is queued.
+    """
+    get_device_or_404(uuid)
+    timestamp = reading.timestamp or datetime.now()
+    if not ingest_queue.offer(uuid, timestamp, reading.value, reading.unit):
+        raise HTTPException(status_code=503, detail="Ingestion queue is full", headers={"Retry-After": "1"})
+    return {"queued": True}
+
+@app.get("/smarthouse/ingest/metrics")
+async def get_ingest_metrics():
+    """
+    This endpoint returns the state of the ingestion queue: buffered readings,
+    rejected readings and the latency of the group commits.
+    """
+    return ingest_queue.metrics()
+
+async def get_house_or_404(house_id):
+    # lasting fra disk skal ikke blokkere event-løkken
+    loop = asyncio.get_running_loop()
+    house = await loop.run_in_executor(None, houses.get, house_id)
+    if house is None:
+        raise HTTPException(status_code=404, detail="House not found")
+    return house
+
+@app.get("/houses")
+async def get_houses():
+    """
+    This endpoint lists all houses and whether they are currently loaded.
+    """
+    loaded = set(houses.loaded())
+    return [{"id": house_id, "loaded": house_id in loaded} for house_id in houses.house_ids()]
+
+@app.get("/houses/metrics")
+async def get_houses_metrics():
+    """
+    This endpoint returns how many houses are loaded, their estimated memory and the cache hits and evictions.
+    """
+    return houses.metrics()
+
+@app.post("/houses/refresh")
+async def refresh_houses():
+    """
+    This endpoint updates the snapshots of all houses in parallel worker processes
+    and applies new changes to the loaded houses.
+    """
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(None, houses.prepare)
+    changes = await loop.run_in_executor(None, houses.fetch_changes)
+    houses.apply_changes(changes)
+    return {"prepared": prepared, "refreshed": len(changes)}
+
+@app.get("/houses/{house_id}")
+async def get_house_info(house_id: str):
+    """
+    This endpoint returns the general structure of the given house, like /smarthouse.
+    """
+    house = await get_house_or_404(house_id)
+    return {
+        "no_rooms": house.get_room_count(),
+        "no_floors": len(house.get_floors()),
+        "registered_devices": house.get_device_count(),
+        "area": house.get_area()
+    }
+
+@app.get("/houses/{house_id}/floor")
+async def get_house_floors(house_id: str):
+    """
+    This endpoint returns the floors of the given house.
+    """
+    house = await get_house_or_404(house_id)
+    return [{"floor_number": floor.get_level(), "floor_area": floor.get_area()} for floor in house.get_floors()]
+
+@app.get("/houses/{house_id}/device/{uuid}")
+async def get_house_device(house_id: str, uuid: str):
+    """
+    This endpoint returns information about a device of the given house.
+    """
+    device = (await get_house_or_404(house_id)).get_device_by_id(uuid)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    return device_info(device)
+
+@app.get("/houses/{house_id}/sensor/{uuid}/current")
+async def get_house_sensor_current(house_id: str, uuid: str):
+    """
+    This endpoint returns the latest reading of a sensor of the given house.
+    """
+    device = (await get_house_or_404(house_id)).get_device_by_id(uuid)
+    if device is None:
+        raise HTTPException(status_code=404, detail="Device not found")
+    house_repo = houses.repository(house_id)
+    measurement = await asyncio.get_running_loop().run_in_executor(None, house_repo.get_latest_reading, device)
+    if measurement is None:
+        raise HTTPException(status_code=404, detail="No readings available")
+    return measurement_info(measurement)
+
+def gauges(prefix, values):
+    return {f"smarthouse_{prefix}_{name}": value for name, value in values.items()
+            if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    This endpoint returns the latency histograms of all routes and SQL statements
+    together with the state of the ingestion queue, event hub and actuator writer,
+    in the Prometheus text format.
+    """
+    values = {}
+    values.update(gauges("ingest", ingest_queue.metrics()))
+    values.update(gauges("events", hub.metrics()))
+    values.update(gauges("actuator", actuator_writer.metrics()))
+    values.update(gauges("sync", {"syncs": house_sync.syncs, "failed_syncs": house_sync.failed_syncs,
+                                  "last_sync_seconds": house_sync.last_sync_seconds}))
+    values.update(gauges("response_cache", {"hits": response_cache.hits, "misses": response_cache.misses}))
+    values.update(gauges("houses", houses.metrics()))
+    return PlainTextResponse(metrics.render(values), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == '__main__':
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,84 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional
+from smarthouse.domain import Measurement, SmartHouse
+from smarthouse.persistence import SmartHouseRepository
+
+
+class AsyncSmartHouseRepository:
+    """
+    Async variant of _SmartHouseRepository_ for use from an event loop.
+    Every call runs the corresponding blocking method on a dedicated executor:
+    reads on as many threads as the repository has pooled read connections, so a
+    read thread never has to wait for a connection, and writes on a single thread
+    since SQLite only allows one writer anyway.
+    """
+
+    def __init__(self, repo: SmartHouseRepository) -> None:
+        self.repo = repo
+        self.read_executor = ThreadPoolExecutor(max_workers=repo.readers, thread_name_prefix="db-read")
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+    async def _run(self, executor, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+    async def read(self, fn, *args):
+        """
+        Runs `fn(cursor, *args)` with a pooled read cursor and returns its result.
+        """
+        def run():
+            with self.repo.read_cursor() as cursor:
+                return fn(cursor, *args)
+        return await self._run(self.read_executor, run)
+
+    async def load_smarthouse_deep(self, lazy = False) -> SmartHouse:
+        return await self._run(self.read_executor, self.repo.load_smarthouse_deep, lazy)
+
+    async def get_latest_reading(self, sensor) -> Optional[Measurement]:
+        return await self._run(self.read_executor, self.repo.get_latest_reading, sensor)
+
+    async def get_measurements(self, device_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                               limit: int = 100, after: Optional[tuple] = None) -> tuple:
+        return await self._run(self.read_executor, self.repo.get_measurements, device_id, start, end, limit, after)
+
+    async def get_measurement_buckets(self, device_id: str, every: int, start: Optional[str] = None, end: Optional[str] = None,
+                                      limit: int = 100, after: Optional[int] = None) -> tuple:
+        return await self._run(self.read_executor, self.repo.get_measurement_buckets, device_id, every, start, end, limit, after)
+
+    async def downsample_measurements(self, device_id: str, points: int, start: Optional[str] = None,
+                                      end: Optional[str] = None, method: str = "lttb") -> list:
+        return await self._run(self.read_executor, self.repo.downsample_measurements, device_id, points, start, end, method)
+
+    async def update_actuator_state(self, actuator):
+        await self._run(self.write_executor, self.repo.update_actuator_state, actuator)
+
+    async def update_actuator_states(self, actuators) -> int:
+        return await self._run(self.write_executor, self.repo.update_actuator_states, actuators)
+
+    async def ingest_measurements(self, readings, house: Optional[SmartHouse] = None) -> int:
+        return await self._run(self.write_executor, self.repo.ingest_measurements, readings, house)
+
+    async def daily_aggregates(self, room, unit, start: Optional[str] = None, end: Optional[str] = None) -> dict:
+        return await self._run(self.read_executor, self.repo.daily_aggregates, room, unit, start, end)
+
+    async def hourly_aggregates(self, room, unit, date: str) -> dict:
+        return await self._run(self.read_executor, self.repo.hourly_aggregates, room, unit, date)
+
+    async def calc_avg_temperatures_in_room(self, room, from_date: Optional[str] = None, until_date: Optional[str] = None) -> dict:
+        return await self._run(self.read_executor, self.repo.calc_avg_temperatures_in_room, room, from_date, until_date)
+
+    async def calc_hours_with_humidity_above(self, room, date: str) -> list:
+        return await self._run(self.read_executor, self.repo.calc_hours_with_humidity_above, room, date)
+
+    def close(self):
+        """
+        Waits for running calls and stops the executor threads.
+        """
+        self.read_executor.shutdown(wait=True)
+        self.write_executor.shutdown(wait=True)
@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+from typing import Optional
+
+
+class ActuatorStateCoalescer:
+    """
+    Collects actuator state changes for `window` seconds and saves them with one
+    `update_actuator_states` call. An actuator that is toggled several times within
+    the window is written once, with the state it has when the window closes.
+    Callers await `submit` and return once their change has been saved.
+    """
+
+    def __init__(self, arepo, window: float = 0.05) -> None:
+        self.arepo = arepo
+        self.window = window
+        self.pending = {}
+        self.done = None
+        self.handle = None
+        # metrics
+        self.submitted = 0
+        self.flushes = 0
+        self.written = 0
+
+    async def submit(self, actuator):
+        """
+        Schedules the current state of the actuator to be saved and waits until it is.
+        """
+        self.submitted += 1
+        self.pending[actuator.id] = actuator
+        if self.done is None:
+            loop = asyncio.get_running_loop()
+            self.done = loop.create_future()
+            self.handle = loop.call_later(self.window, lambda: asyncio.ensure_future(self.flush()))
+        # shield: en klient som avbryter skal ikke avbryte skrivingen for de andre
+        await asyncio.shield(self.done)
+
+    async def flush(self) -> Optional[int]:
+        """
+        Saves everything collected so far right away.
+        """
+        if self.done is None:
+            return None
+        actuators = list(self.pending.values())
+        done = self.done
+        self.pending = {}
+        self.done = None
+        self.handle.cancel()
+        try:
+            written = await self.arepo.update_actuator_states(actuators)
+        except Exception as e:
+            done.set_exception(e)
+            # hentes av de som venter; uten ventende skal feilen ikke logges som uhåndtert
+            done.exception()
+            return None
+        self.flushes += 1
+        self.written += written
+        done.set_result(written)
+        return written
+
+    def metrics(self) -> dict:
+        return {
+            "submitted": self.submitted,
+            "flushes": self.flushes,
+            "written": self.written,
+            "pending": len(self.pending),
+        }
@@ -1,39 +1,200 @@
 from codecs import raw_unicode_escape_decode
+from array import array
+from bisect import bisect_left, bisect_right
+from calendar import timegm
 from datetime import datetime, time
+from functools import lru_cache
 import random
+import time as clock
+
+
+def to_epoch(timestamp):
+    """
+    Converts a timestamp (a `datetime` or an ISO 8601 string as stored in the
+    database) into whole seconds since the epoch. Naive timestamps are taken as UTC.
+    """
+    if isinstance(timestamp, (int, float)):
+        return int(timestamp)
+    if isinstance(timestamp, str) and len(timestamp) == 19 and timestamp[13] == ':':
+        # vanlig format i databasen: "YYYY-MM-DD HH:MM:SS"
+        return (_day_epoch(timestamp[:10]) + int(timestamp[11:13]) * 3600
+                + int(timestamp[14:16]) * 60 + int(timestamp[17:19]))
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp))
+    return timegm(timestamp.utctimetuple())
+
+
+@lru_cache(maxsize=4096)
+def _day_epoch(day):
+    return timegm(datetime.fromisoformat(day).timetuple())
+
+
+def from_epoch(epoch):
+    """
+    Formats seconds since the epoch the same way timestamps are stored in the database.
+    """
+    # strftime("%Y") fyller ikke ut år før 1000 med nuller på alle plattformer
+    t = clock.gmtime(epoch)
+    return f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
 
 class Measurement:
     """
     This class represents a measurement taken from a sensor.
     """
 
+    __slots__ = ("timestamp", "value", "unit")
+
     def __init__(self, timestamp, value, unit):
         self.timestamp = timestamp
         self.value = value
         self.unit = unit
 
+class MeasurementSeries:
+    """
+    Columnar storage for the measurement history of a device. Timestamps are
+    kept as epoch seconds and values as doubles in `array` buffers, and each
+    distinct unit is stored once and referenced by a small code. Indexing and
+    iteration yield `Measurement` objects, so it can be used like a list.
+    The readings are always sorted by timestamp, which lets the range queries
+    find their bounds by binary search.
+    """
+
+    __slots__ = ("timestamps", "values", "unit_codes", "units", "unit_index")
+
+    def __init__(self):
+        self.timestamps = array('q')
+        self.values = array('d')
+        self.unit_codes = array('H')
+        self.units = []
+        self.unit_index = {}
+
+    def _unit_code(self, unit):
+        code = self.unit_index.get(unit)
+        if code is None:
+            code = len(self.units)
+            self.units.append(unit)
+            self.unit_index[unit] = code
+        return code
+
+    def add(self, epoch, value, unit):
+        """
+        Adds a raw reading without creating a `Measurement` object. Readings
+        arriving out of order are inserted at their place, after any reading with
+        the same timestamp; this costs O(n) instead of O(1) for an append.
+        """
+        timestamps = self.timestamps
+        if not timestamps or epoch >= timestamps[-1]:
+            timestamps.append(epoch)
+            self.values.append(value)
+            self.unit_codes.append(self._unit_code(unit))
+        else:
+            i = bisect_right(timestamps, epoch)
+            timestamps.insert(i, epoch)
+            self.values.insert(i, value)
+            self.unit_codes.insert(i, self._unit_code(unit))
+
+    def append(self, measurement):
+        self.add(to_epoch(measurement.timestamp), float(measurement.value), measurement.unit)
+
+    def measurement(self, index):
+        return Measurement(from_epoch(self.timestamps[index]), self.values[index], self.units[self.unit_codes[index]])
+
+    def last(self):
+        if self.timestamps:
+            return self.measurement(-1)
+        return None
+
+    def index_range(self, start = None, end = None):
+        """
+        Returns the positions (lo, hi) of the readings with `start <= timestamp <= end`,
+        found by binary search. Open ends are given as None.
+        """
+        lo = 0 if start is None else bisect_left(self.timestamps, to_epoch(start))
+        hi = len(self.timestamps) if end is None else bisect_right(self.timestamps, to_epoch(end))
+        return lo, max(lo, hi)
+
+    def between(self, start = None, end = None):
+        """
+        Returns the readings from `start` to `end` (both included) in O(log n + k).
+        """
+        lo, hi = self.index_range(start, end)
+        return [self.measurement(i) for i in range(lo, hi)]
+
+    def at_or_before(self, timestamp):
+        """
+        Returns the latest reading taken at or before `timestamp`, or None.
+        """
+        i = bisect_right(self.timestamps, to_epoch(timestamp))
+        return self.measurement(i - 1) if i else None
+
+    def window(self, timestamp, seconds):
+        """
+        Returns the readings of the `seconds` up to and including `timestamp`.
+        """
+        end = to_epoch(timestamp)
+        return self.between(end - seconds, end)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.measurement(i) for i in range(*index.indices(len(self)))]
+        return self.measurement(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.measurement(i)
+
+
 class Floor:
+    __slots__ = ("level", "rooms", "_area")
+
     def __init__(self, level):
         self.level = level
         self.rooms = []
+        # summen av romarealene, None når den må regnes ut på nytt
+        self._area = None
         
     def get_area(self):
-        total_area = 0
-        total_area = sum(room.area for room in self.rooms)
-        return total_area
+        if self._area is None:
+            self._area = sum(room.area for room in self.rooms)
+        return self._area
     
     def add_room(self, room):
         self.rooms.append(room)
+        self._area = None
+
+    def remove_room(self, room):
+        self.rooms.remove(room)
+        self._area = None
     
     def get_level(self):
         return self.level
 
 class Room:
-    def __init__(self, area, floor, room_name = None):
+    __slots__ = ("room_name", "room_id", "_area", "floor", "devices", "house")
+
+    def __init__(self, area, floor, room_name = None, room_id = None):
         self.room_name = room_name
-        self.area = area
+        self.room_id = room_id
         self.floor = floor
         self.devices = []
+        self.house = None
+        self.area = area
+
+    @property
+    def area(self):
+        return self._area
+
+    @area.setter
+    def area(self, area):
+        # arealet er bufret i etasjen og huset, så de må vite om endringen
+        self._area = area
+        if self.floor is not None:
+            self.floor._area = None
+        if self.house is not None:
+            self.house.touch()
 
     def add_device(self, device):
         self.devices.append(device)
@@ -42,8 +203,12 @@ class Room:
         if device in self.devices:
             device.room = None  
             self.devices.remove(device)
+            if self.house:
+                self.house.unindex_device(device)
         
 class Device:
+    __slots__ = ("id", "supplier", "model_name", "device_type", "category", "room", "measurement_history")
+
     def __init__(self, id, supplier, model_name, device_type, category, room = None):
         self.id = id
         self.supplier = supplier
@@ -51,7 +216,7 @@ class Device:
         self.device_type = device_type
         self.category = category
         self.room = room
-        self.measurement_history = []
+        self.measurement_history = MeasurementSeries()
     
     def is_actuator(self):
         if self.category == 'aktuator':
@@ -67,10 +232,19 @@ class Device:
         return self.device_type
     
     def last_measurement(self):
-        if self.measurement_history:
-            return self.measurement_history[-1]
-        else:
-            return None
+        return self.measurement_history.last()
+
+    def measurements_between(self, start = None, end = None):
+        return self.measurement_history.between(start, end)
+
+    def measurement_at(self, timestamp):
+        """
+        The reading that was current at the given time, i.e. the latest one taken at or before it.
+        """
+        return self.measurement_history.at_or_before(timestamp)
+
+    def measurements_window(self, timestamp, seconds):
+        return self.measurement_history.window(timestamp, seconds)
     
     def add_measurement(self, unit):
         timestamp = datetime.now()
@@ -82,10 +256,14 @@ class Device:
         self.measurement_history.append(Measurement)
 
 class Sensor(Device):
+    __slots__ = ()
+
     def __init__(self, id, producer, model, device_type, category = 'sensor'):
         super().__init__(id, producer, model, device_type, category)
 
 class Aktuator(Device):
+    __slots__ = ("state",)
+
     def __init__(self, id, producer, model, device_type, category = 'aktuator'):
         super().__init__(id, producer, model, device_type, category)
         self.state = 0
@@ -113,9 +291,33 @@ class SmartHouse:
     The SmartHouse class provides functionality to register rooms and floors (i.e. changing the 
     house's physical layout) as well as register and modify smart devices and their state.
     """
+
+    __slots__ = ("name", "floors", "floors_by_level", "rooms", "rooms_by_name", "rooms_by_id", "devices_by_id",
+                 "synced_seq", "synced_rowid", "version", "_area")
+
     def __init__(self, name = None):
         self.name = name
         self.floors = []
+        # Oppslagstabeller slik at vi slipper å gå gjennom etasje -> rom -> enhet
+        self.floors_by_level = {}
+        self.rooms = []
+        self.rooms_by_name = {}
+        self.rooms_by_id = {}
+        self.devices_by_id = {}
+        # høyvannsmerker i databasen som dette huset er oppdatert til (se SmartHouseRepository.fetch_changes)
+        self.synced_seq = 0
+        self.synced_rowid = 0
+        # økes ved hver endring av etasjer, rom og enheter; _area er bufret for gjeldende versjon
+        self.version = 0
+        self._area = None
+
+    def touch(self):
+        """
+        This method marks the structure of the house as changed: the version
+        is increased and cached aggregates are computed anew when requested.
+        """
+        self.version += 1
+        self._area = None
 
     def register_floor(self, level):
         """
@@ -125,17 +327,68 @@ class SmartHouse:
         
         floor = Floor(level)
         self.floors.append(floor)
+        self.floors_by_level[level] = floor
+        self.touch()
         return floor
         
-    def register_room(self, floor, room_size, room_name = None):
+    def register_room(self, floor, room_size, room_name = None, room_id = None):
         """
         This methods registers a new room with the given room areal size 
-        at the given floor. Optionally the room may be assigned a mnemonic name.
+        at the given floor. Optionally the room may be assigned a mnemonic name
+        and the id it has in the database.
         """
-        room = Room(room_size, floor, room_name)
+        room = Room(room_size, floor, room_name, room_id)
+        room.house = self
         floor.add_room(room)
+        self.rooms.append(room)
+        if room_name is not None:
+            self.rooms_by_name[room_name] = room
+        if room_id is not None:
+            self.rooms_by_id[room_id] = room
+        self.touch()
         return room
 
+    def update_room(self, room, floor, room_size, room_name = None):
+        """
+        This method moves the given room to the given floor and changes
+        its area size and name, keeping the lookup tables up to date.
+        """
+        if room.floor is not floor:
+            self._detach_room(room)
+            floor.add_room(room)
+            room.floor = floor
+        room.area = room_size
+        if room.room_name != room_name:
+            if self.rooms_by_name.get(room.room_name) is room:
+                del self.rooms_by_name[room.room_name]
+            room.room_name = room_name
+            if room_name is not None:
+                self.rooms_by_name[room_name] = room
+        self.touch()
+
+    def remove_room(self, room):
+        """
+        This method removes the given room together with its devices from the house.
+        """
+        for device in list(room.devices):
+            room.remove_device(device)
+        self._detach_room(room)
+        self.rooms.remove(room)
+        if self.rooms_by_name.get(room.room_name) is room:
+            del self.rooms_by_name[room.room_name]
+        if self.rooms_by_id.get(room.room_id) is room:
+            del self.rooms_by_id[room.room_id]
+        room.house = None
+        self.touch()
+
+    def _detach_room(self, room):
+        floor = room.floor
+        floor.remove_room(room)
+        # en etasje uten rom finnes ikke lenger
+        if not floor.rooms and self.floors_by_level.get(floor.level) is floor:
+            self.floors.remove(floor)
+            del self.floors_by_level[floor.level]
+
     def get_floors(self):
         """
         This method returns the list of registered floors in the house.
@@ -153,23 +406,42 @@ class SmartHouse:
         The resulting list has no particular order.
         """
         
-        all_rooms = []
-        
-        for floor in self.floors:
-            for room in floor.rooms:
-                all_rooms.append(room)
-        
-        return all_rooms
+        return list(self.rooms)
+
+    def get_room_count(self):
+        """
+        This method returns the number of registered rooms without building a list.
+        """
+        return len(self.rooms)
+
+    def get_floor(self, level):
+        """
+        This method retrieves the floor registered at the given level.
+        """
+        return self.floors_by_level.get(level)
+
+    def get_room_by_name(self, room_name):
+        """
+        This method retrieves a room via its mnemonic name.
+        """
+        return self.rooms_by_name.get(room_name)
+
+    def get_room_by_id(self, room_id):
+        """
+        This method retrieves a room via its database id.
+        """
+        return self.rooms_by_id.get(room_id)
 
     def get_area(self):
         """
         This methods return the total area size of the house, i.e. the sum of the area sizes of each room in the house.
         """
-        total_area = 0
-        for floor in self.floors:
-            total_area += floor.get_area()
-         
-        return total_area
+        if self._area is None:
+            total_area = 0
+            for floor in self.floors:
+                total_area += floor.get_area()
+            self._area = total_area
+        return self._area
 
     def register_device(self, room, device):
         """
@@ -180,23 +452,30 @@ class SmartHouse:
 
         room.add_device(device)
         device.room = room
+        self.devices_by_id[device.id] = device
+        self.touch()
         return device
 
+    def unindex_device(self, device):
+        """
+        This method drops a device from the lookup tables of the house,
+        e.g. after it has been removed from its room.
+        """
+        if self.devices_by_id.get(device.id) is device:
+            del self.devices_by_id[device.id]
+        self.touch()
+
     def get_device_by_id(self, device_id):
         """
         This method retrieves a device object via its id.
         """
-        for floor in self.floors:
-            for room in floor.rooms:
-                for device in room.devices:
-                    if device.id == device_id:
-                        return device
-        return None
+        return self.devices_by_id.get(device_id)
     
     def get_devices(self):
-        all_devices = []
-        for floor in self.floors:
-            for room in floor.rooms:
-                for device in room.devices:
-                    all_devices.append(device)
-        return all_devices
\ No newline at end of file
+        return list(self.devices_by_id.values())
+
+    def get_device_count(self):
+        """
+        This method returns the number of registered devices without building a list.
+        """
+        return len(self.devices_by_id)
\ No newline at end of file
@@ -0,0 +1,84 @@
+# Reduces a time series to a given number of points for plotting. The functions take
+# parallel sequences of timestamps (epoch seconds) and values, e.g. the columns of a
+# MeasurementSeries, and return the indices of the points to keep in time order.
+
+LTTB = "lttb"
+MINMAX = "minmax"
+METHODS = (LTTB, MINMAX)
+
+
+def lttb(timestamps, values, points: int) -> list:
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and the last point and from every
+    one of `points - 2` equally sized buckets in between the point forming the largest
+    triangle with the previously kept point and the average of the next bucket.
+    Keeps the visual shape of the series, including single spikes.
+    """
+    n = len(values)
+    if points >= n or points < 3:
+        return list(range(n))
+    every = (n - 2) / (points - 2)
+    kept = [0]
+    a = 0
+    for i in range(points - 2):
+        # gjennomsnittet av neste bøtte er tredje hjørne i trekanten
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        count = avg_end - avg_start
+        avg_x = sum(timestamps[avg_start:avg_end]) / count
+        avg_y = sum(values[avg_start:avg_end]) / count
+
+        ax = timestamps[a]
+        ay = values[a]
+        # arealet er |dx * y + dy * x + c| / 2, så konstantene regnes ut én gang per bøtte
+        dx = ax - avg_x
+        dy = avg_y - ay
+        c = -dx * ay - dy * ax
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best = start
+        best_area = -1.0
+        for j, x, y in zip(range(start, end), timestamps[start:end], values[start:end]):
+            area = abs(dx * y + dy * x + c)
+            if area > best_area:
+                best_area = area
+                best = j
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def minmax(timestamps, values, points: int) -> list:
+    """
+    Min/max bucketing: splits the series into `points // 2` equally sized buckets and
+    keeps the lowest and the highest value of each, so no extreme value is lost.
+    """
+    n = len(values)
+    buckets = points // 2
+    if points >= n or buckets < 1:
+        return list(range(n))
+    size = n / buckets
+    kept = []
+    get = values.__getitem__
+    for i in range(buckets):
+        start = int(i * size)
+        end = int((i + 1) * size)
+        low = min(range(start, end), key=get)
+        high = max(range(start, end), key=get)
+        if low == high:
+            kept.append(low)
+        else:
+            kept.extend((low, high) if low < high else (high, low))
+    return kept
+
+
+def downsample(timestamps, values, points: int, method: str = LTTB) -> list:
+    """
+    Returns the indices kept by the given method (`"lttb"` or `"minmax"`).
+    """
+    if method == LTTB:
+        return lttb(timestamps, values, points)
+    if method == MINMAX:
+        return minmax(timestamps, values, points)
+    raise ValueError(f"unknown downsampling method: {method}")
@@ -0,0 +1,64 @@
+import csv
+import io
+import json
+import zlib
+
+# number of rows serialized into one chunk of the response
+CHUNK_ROWS = 2000
+
+CSV_HEADER = ("device", "timestamp", "value", "unit")
+
+
+def ndjson_chunks(rows, chunk_rows: int = CHUNK_ROWS):
+    """
+    Turns (device, timestamp, value, unit) rows into newline delimited JSON,
+    one object per line, yielded as strings of up to `chunk_rows` lines.
+    """
+    dumps = json.dumps
+    lines = []
+    for device, ts, value, unit in rows:
+        lines.append(f'{{"device":{dumps(device)},"timestamp":{dumps(ts)},"value":{dumps(value)},"unit":{dumps(unit)}}}\n')
+        if len(lines) >= chunk_rows:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def csv_chunks(rows, chunk_rows: int = CHUNK_ROWS):
+    """
+    Turns (device, timestamp, value, unit) rows into CSV with a header line,
+    yielded as strings of up to `chunk_rows` lines.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(CSV_HEADER)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count >= chunk_rows:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            count = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks, level: int = 6):
+    """
+    Compresses a stream of string chunks into a gzip stream of bytes
+    without holding more than one chunk in memory.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode_chunks(chunks):
+    for chunk in chunks:
+        yield chunk.encode("utf-8")
@@ -0,0 +1,251 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import multiprocessing
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from smarthouse.domain import SmartHouse, MeasurementSeries
+from smarthouse.persistence import SmartHouseRepository
+
+# house ids become file names, so only simple names are accepted
+HOUSE_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# rough sizes in bytes of the objects behind a room and a device
+ROOM_BYTES = 1000
+DEVICE_BYTES = 2000
+
+
+def estimate_size(house: SmartHouse) -> int:
+    """
+    Estimates the memory held by a loaded house: a fixed amount per room and
+    device plus the measurement columns of every in-memory history.
+    """
+    size = ROOM_BYTES * house.get_room_count()
+    for device in house.get_devices():
+        size += DEVICE_BYTES
+        history = device.measurement_history
+        if isinstance(history, MeasurementSeries):
+            size += sum(len(column) * column.itemsize for column in (history.timestamps, history.values, history.unit_codes))
+    return size
+
+
+def prepare_snapshot(file: str) -> str:
+    """
+    Runs in a worker process: loads the house of the given database and rewrites
+    its snapshot if it is missing or out of date, so the house can afterwards be
+    read from the snapshot quickly.
+    """
+    repo = SmartHouseRepository(file)
+    try:
+        repo.load_smarthouse_cached()
+    finally:
+        repo.pool.close()
+    return file
+
+
+class HouseRegistry:
+    """
+    Manages many houses, one SQLite database per house stored as `<house id>.sql`
+    in `directory`. Houses are loaded on demand (from their snapshot when possible)
+    and kept in memory in least recently used order; when the estimated size of all
+    loaded houses exceeds `memory_budget` bytes the least recently used ones are
+    evicted and their connections closed. Loading and refreshing many houses is done
+    in parallel by a pool of `workers` processes that bring the snapshots up to date.
+    """
+
+    def __init__(self, directory, memory_budget: int = 512 * 1024 * 1024, lazy = False,
+                 workers: Optional[int] = None) -> None:
+        self.directory = Path(directory)
+        self.memory_budget = memory_budget
+        self.lazy = lazy
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        self.lock = threading.Lock()
+        # house id -> lock held while the house is loaded
+        self.loading = {}
+        # house id -> (repository, house, size), least recently used first
+        self.houses = OrderedDict()
+        self.size = 0
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def file(self, house_id: str) -> Optional[Path]:
+        """
+        The database file of the given house, or None if there is no such house.
+        """
+        if not HOUSE_ID.fullmatch(house_id):
+            return None
+        file = self.directory / f"{house_id}.sql"
+        return file if file.is_file() else None
+
+    def house_ids(self) -> list:
+        if not self.directory.is_dir():
+            return []
+        return sorted(file.stem for file in self.directory.glob("*.sql") if HOUSE_ID.fullmatch(file.stem))
+
+    def loaded(self) -> list:
+        with self.lock:
+            return list(self.houses)
+
+    def _lookup(self, house_id):
+        entry = self.houses.get(house_id)
+        if entry is not None:
+            self.houses.move_to_end(house_id)
+            self.hits += 1
+        return entry
+
+    def _load(self, house_id):
+        with self.lock:
+            entry = self._lookup(house_id)
+            if entry is not None:
+                return entry
+        file = self.file(house_id)
+        if file is None:
+            return None
+        with self.lock:
+            loading = self.loading.setdefault(house_id, threading.Lock())
+        with loading:
+            # kan ha blitt lastet av en annen tråd mens vi ventet
+            with self.lock:
+                entry = self._lookup(house_id)
+                if entry is not None:
+                    return entry
+            repo = SmartHouseRepository(str(file))
+            house = repo.load_smarthouse_cached(self.lazy)
+            entry = (repo, house, estimate_size(house))
+            with self.lock:
+                self.misses += 1
+                self.houses[house_id] = entry
+                self.size += entry[2]
+                self._evict()
+            return entry
+
+    def _evict(self):
+        # det sist brukte huset beholdes selv om det alene er større enn budsjettet
+        while self.size > self.memory_budget and len(self.houses) > 1:
+            _, (repo, _, size) = self.houses.popitem(last=False)
+            self.size -= size
+            self.evictions += 1
+            repo.pool.close()
+
+    def get(self, house_id: str) -> Optional[SmartHouse]:
+        """
+        Returns the house with the given id, loading it if necessary,
+        or None if there is no such house.
+        """
+        entry = self._load(house_id)
+        return entry[1] if entry is not None else None
+
+    def repository(self, house_id: str) -> Optional[SmartHouseRepository]:
+        """
+        Returns the repository of the given house, loading the house if necessary.
+        The repository is closed when the house is evicted.
+        """
+        entry = self._load(house_id)
+        return entry[0] if entry is not None else None
+
+    def evict(self, house_id: str):
+        with self.lock:
+            entry = self.houses.pop(house_id, None)
+            if entry is not None:
+                self.size -= entry[2]
+                entry[0].pool.close()
+
+    def _executor(self):
+        if self.executor is None:
+            # spawn, siden fork av en prosess med tråder og åpne SQLite-forbindelser ikke er trygt
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def prepare(self, house_ids: Optional[list] = None) -> int:
+        """
+        Brings the snapshots of the given houses (all houses by default) up to date
+        in parallel worker processes. Returns the number of houses prepared.
+        """
+        files = [str(file) for file in map(self.file, self.house_ids() if house_ids is None else house_ids) if file]
+        if len(files) == 1:
+            prepare_snapshot(files[0])
+        elif files:
+            list(self._executor().map(prepare_snapshot, files))
+        return len(files)
+
+    def load(self, house_ids: Optional[list] = None) -> int:
+        """
+        Loads the given houses (all houses by default) that are not loaded yet: their
+        snapshots are prepared in parallel and then read, within the memory budget.
+        Returns the number of houses loaded.
+        """
+        loaded = set(self.loaded())
+        missing = [house_id for house_id in (self.house_ids() if house_ids is None else house_ids) if house_id not in loaded]
+        self.prepare(missing)
+        return sum(1 for house_id in missing if self.get(house_id) is not None)
+
+    def fetch_changes(self) -> dict:
+        """
+        Reads the changes of all loaded houses since they were loaded or last refreshed,
+        in parallel threads. Returns house id -> (house, changes), see `apply_changes`.
+        """
+        with self.lock:
+            entries = list(self.houses.items())
+        if not entries:
+            return {}
+        with ThreadPoolExecutor(min(len(entries), self.workers)) as executor:
+            changes = executor.map(lambda entry: entry[1][0].fetch_changes(entry[1][1], self.lazy), entries)
+            return {house_id: (house, change) for (house_id, (_, house, _)), change in zip(entries, changes)}
+
+    def apply_changes(self, changes: dict):
+        """
+        Applies changes read by `fetch_changes` to the houses that are still loaded.
+        """
+        for house_id, (house, change) in changes.items():
+            with self.lock:
+                entry = self.houses.get(house_id)
+            if entry is None or entry[1] is not house:
+                continue
+            repo, _, size = entry
+            repo.apply_changes(house, change, self.lazy)
+            with self.lock:
+                if self.houses.get(house_id) is entry:
+                    new_size = estimate_size(house)
+                    self.houses[house_id] = (repo, house, new_size)
+                    self.size += new_size - size
+                    self._evict()
+
+    def refresh(self):
+        """
+        Updates the snapshots of all houses in parallel and applies new changes to the
+        loaded houses. Applying changes mutates the houses, so callers serving requests
+        from the houses should call `fetch_changes` and `apply_changes` themselves.
+        """
+        self.prepare()
+        self.apply_changes(self.fetch_changes())
+
+    def metrics(self) -> dict:
+        houses = len(self.house_ids())
+        with self.lock:
+            return {
+                "houses": houses,
+                "loaded": len(self.houses),
+                "loaded_bytes": self.size,
+                "memory_budget": self.memory_budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def close(self):
+        with self.lock:
+            for repo, _, _ in self.houses.values():
+                repo.pool.close()
+            self.houses.clear()
+            self.size = 0
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
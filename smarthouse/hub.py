@@ -0,0 +1,143 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+import time
+from typing import Optional
+from smarthouse.domain import SmartHouse
+
+
+class Subscription:
+    """
+    One live consumer of the hub, interested in the whole house, one room or one device.
+    Events waiting for the consumer are kept per (type, device, unit), so a burst of
+    readings from one sensor collapses into its latest value.
+    """
+
+    def __init__(self, room_id = None, device_id = None, coalesce: float = 0.25) -> None:
+        self.room_id = room_id
+        self.device_id = device_id
+        self.coalesce = coalesce
+        self.pending = {}
+        self.pending_since = None
+        self.wakeup = asyncio.Event()
+        self.dropped = False
+
+    def matches(self, event) -> bool:
+        if self.device_id is not None:
+            return event["device"] == self.device_id
+        if self.room_id is not None:
+            return event["room"] == self.room_id
+        return True
+
+    def push(self, key, event, now):
+        if not self.pending:
+            self.pending_since = now
+        self.pending[key] = event
+        self.wakeup.set()
+
+    async def next(self, timeout: float = 15.0) -> Optional[list]:
+        """
+        Waits for events and returns them as a list, after letting a burst settle for
+        `coalesce` seconds. Returns an empty list if nothing happened within `timeout`
+        seconds and None once the subscription has been dropped.
+        """
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None if self.dropped else []
+        if self.dropped:
+            return None
+        if self.coalesce:
+            await asyncio.sleep(self.coalesce)
+        events = list(self.pending.values())
+        self.pending = {}
+        self.pending_since = None
+        self.wakeup.clear()
+        return events
+
+
+class EventHub:
+    """
+    Publish/subscribe hub for live readings and actuator changes. The repository
+    reports every committed ingestion batch and actuator update (`publish`, safe to call
+    from any thread) and the hub hands the changes to all matching subscriptions on the
+    event loop. Consumers that leave events unread for more than `max_lag` seconds are
+    dropped, so a slow client can never make the hub buffer without bounds.
+    """
+
+    def __init__(self, house: SmartHouse, max_subscribers: int = 1000, max_lag: float = 10.0,
+                 coalesce: float = 0.25) -> None:
+        self.house = house
+        self.max_subscribers = max_subscribers
+        self.max_lag = max_lag
+        self.coalesce = coalesce
+        self.loop = None
+        self.subscriptions = set()
+        # metrics
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+
+    def subscribe(self, room_id = None, device_id = None) -> Optional[Subscription]:
+        """
+        Registers a new consumer for the whole house, a room or a device.
+        Returns None if the hub already has `max_subscribers` consumers.
+        """
+        if len(self.subscriptions) >= self.max_subscribers:
+            return None
+        subscription = Subscription(room_id, device_id, self.coalesce)
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, kind: str, changes: list):
+        """
+        Listener for `SmartHouseRepository.add_listener`: `changes` are
+        (device, timestamp, value, unit) rows for kind "measurement" and
+        (device, state) pairs for kind "actuator".
+        """
+        if self.loop is None or not self.subscriptions:
+            return
+        self.loop.call_soon_threadsafe(self._dispatch, kind, changes)
+
+    def _event(self, kind, change):
+        device = self.house.get_device_by_id(change[0])
+        room = device.room.room_id if device is not None and device.room is not None else None
+        if kind == "measurement":
+            device_id, ts, value, unit = change
+            return (kind, device_id, unit), {"type": kind, "device": device_id, "room": room,
+                                              "timestamp": ts, "value": value, "unit": unit}
+        device_id, state = change
+        return (kind, device_id, None), {"type": kind, "device": device_id, "room": room, "state": state}
+
+    def _dispatch(self, kind, changes):
+        now = time.monotonic()
+        events = [self._event(kind, change) for change in changes]
+        self.published += len(events)
+        for subscription in list(self.subscriptions):
+            # en konsument som ikke har lest på lenge kobles fra
+            if subscription.pending and now - subscription.pending_since > self.max_lag:
+                self.subscriptions.discard(subscription)
+                subscription.dropped = True
+                subscription.wakeup.set()
+                self.dropped += 1
+                continue
+            for key, event in events:
+                if subscription.matches(event):
+                    subscription.push(key, event, now)
+                    self.delivered += 1
+
+    def metrics(self) -> dict:
+        return {
+            "subscribers": len(self.subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,204 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from smarthouse.domain import SmartHouse, to_epoch, from_epoch
+
+log = logging.getLogger(__name__)
+
+
+class IngestQueue:
+    """
+    Buffers incoming sensor readings and writes them to the repository in group
+    commits: a flush happens when `max_batch` readings are waiting or the oldest
+    waiting reading is `max_delay` seconds old, whichever comes first.
+    At most `max_pending` readings are buffered; beyond that `offer` refuses new
+    readings and `put` waits, which gives producers backpressure.
+    Writes run on a dedicated thread so the event loop is never blocked by SQLite.
+    A failed batch is retried with the next flush; after `max_attempts` failures it
+    is split up so the readings that cannot be written are found, logged and dropped
+    while the others are stored.
+    """
+
+    def __init__(self, repo, house: Optional[SmartHouse] = None, max_batch: int = 5000,
+                 max_delay: float = 0.5, max_pending: int = 100000, max_attempts: int = 3) -> None:
+        self.repo = repo
+        self.house = house
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.queue = None
+        self.task = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+        # lesninger fra en mislykket skriving og antall forsøk så langt
+        self.retry = []
+        self.attempts = 0
+        # metrics
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.dropped = 0
+        self.last_error = None
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def start(self):
+        """
+        Starts the writer task on the running event loop.
+        """
+        if self.task is None:
+            self.queue = asyncio.Queue(maxsize=self.max_pending)
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Stops accepting readings, writes everything that is still buffered and
+        waits until it is committed. Call this on shutdown so no reading is lost.
+        """
+        if self.task is None:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+        # siste sjanse: det som fortsatt feiler blir logget og forkastet
+        while self.retry:
+            await self._flush([], final=True)
+        self.executor.shutdown(wait=True)
+
+    def _reading(self, device, ts, value, unit):
+        # ugyldige lesninger avvises her, ellers ville de stoppet hele batchen de havner i
+        device_id = device if isinstance(device, str) else device.id
+        return (device_id, from_epoch(to_epoch(ts)), float(value), unit, time.monotonic())
+
+    def _full(self):
+        return self.queue.full() or self.queue.qsize() + len(self.retry) >= self.max_pending
+
+    def offer(self, device, ts, value, unit) -> bool:
+        """
+        Buffers a reading without waiting. Returns False if the buffer is full.
+        Raises ValueError (or TypeError) for a reading that cannot be stored.
+        """
+        reading = self._reading(device, ts, value, unit)
+        if self._full():
+            self.rejected += 1
+            return False
+        self.queue.put_nowait(reading)
+        self.accepted += 1
+        return True
+
+    async def put(self, device, ts, value, unit):
+        """
+        Buffers a reading, waiting for free space if the buffer is full.
+        Raises ValueError (or TypeError) for a reading that cannot be stored.
+        """
+        reading = self._reading(device, ts, value, unit)
+        while self.retry and self._full():
+            # lesninger som venter på nytt forsøk teller med i grensen
+            await asyncio.sleep(self.max_delay)
+        await self.queue.put(reading)
+        self.accepted += 1
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[4] + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self.queue.get_nowait() if timeout <= 0 else await asyncio.wait_for(self.queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+        # det som fortsatt ligger i køen ved stopp skrives også
+        rest = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                rest.append(item)
+        if rest or self.retry:
+            await self._flush(rest)
+
+    async def _flush(self, batch, final = False):
+        batch = self.retry + batch
+        self.retry = []
+        if not batch:
+            return
+        if await self._write(batch):
+            self.attempts = 0
+            return
+        self.attempts += 1
+        if self.attempts < self.max_attempts and not final:
+            # beholdes og prøves igjen ved neste skriving
+            self.retry = batch
+            return
+        self.attempts = 0
+        await self._isolate(batch)
+
+    async def _isolate(self, batch):
+        # halverer batchen til lesningene som ikke kan skrives er funnet, resten lagres
+        if len(batch) == 1:
+            self.dropped += 1
+            log.error("dropping reading %r after %d failed attempts: %s", batch[0][:4], self.max_attempts, self.last_error)
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            if not await self._write(half):
+                await self._isolate(half)
+
+    async def _write(self, batch) -> bool:
+        readings = [item[:4] for item in batch]
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        try:
+            written = await loop.run_in_executor(self.executor, self.repo.ingest_measurements, readings, self.house)
+        except Exception as e:
+            self.failed_flushes += 1
+            self.last_error = repr(e)
+            return False
+        end = time.monotonic()
+        self.written += written
+        self.flushes += 1
+        self.last_flush_seconds = end - start
+        self.max_flush_seconds = max(self.max_flush_seconds, self.last_flush_seconds)
+        self.total_flush_seconds += self.last_flush_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, end - min(item[4] for item in batch))
+        return True
+
+    def metrics(self) -> dict:
+        """
+        Current state of the queue: buffered readings, totals and flush latencies in seconds.
+        """
+        return {
+            "pending": self.accepted - self.written - self.dropped,
+            "retrying": len(self.retry),
+            "max_pending": self.max_pending,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "dropped": self.dropped,
+            "last_error": self.last_error,
+            "last_flush_seconds": self.last_flush_seconds,
+            "max_flush_seconds": self.max_flush_seconds,
+            "avg_flush_seconds": self.total_flush_seconds / self.flushes if self.flushes else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+        }
@@ -0,0 +1,226 @@
+import sqlite3
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# upper bounds in seconds, +Inf is implicit
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Counts observed values per bucket (not cumulative, that is done when rendering)
+    and keeps their sum, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Latency histograms per API route and per SQL statement, with the number of rows
+    each statement returned or changed, rendered in the Prometheus text format.
+    Recording can be switched off with `enabled`; the middleware and the cursor
+    factory then pass straight through to the untraced code.
+    """
+
+    def __init__(self, enabled: bool = True, buckets = DEFAULT_BUCKETS) -> None:
+        self.enabled = enabled
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # (method, route, status) -> Histogram
+        self.requests = {}
+        # statement -> Histogram
+        self.statements = {}
+        # statement -> rows
+        self.rows = {}
+        # SQL as written in the code -> statement label on one line
+        self.labels = {}
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        key = (method, route, status)
+        with self.lock:
+            histogram = self.requests.get(key)
+            if histogram is None:
+                histogram = self.requests[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_statement(self, sql: str, seconds: float, rows: int):
+        label = self.labels.get(sql)
+        if label is None:
+            label = self.labels[sql] = " ".join(sql.split())
+        with self.lock:
+            histogram = self.statements.get(label)
+            if histogram is None:
+                histogram = self.statements[label] = Histogram(self.buckets)
+                self.rows[label] = 0
+            histogram.observe(seconds)
+            self.rows[label] += rows
+
+    def cursor(self, connection: sqlite3.Connection) -> sqlite3.Cursor:
+        """
+        Cursor factory for `sqlite3.Connection.cursor`, see `SmartHouseRepository.trace`.
+        """
+        if self.enabled:
+            return TracingCursor(connection, self)
+        return sqlite3.Cursor(connection)
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.statements.clear()
+            self.rows.clear()
+
+    def _histogram_lines(self, name, series):
+        lines = []
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{_format(bound)}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {_format(histogram.sum)}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+    def render(self, gauges: dict = None) -> str:
+        """
+        Returns all recorded metrics in the Prometheus text exposition format,
+        followed by the given gauges (name -> number).
+        """
+        with self.lock:
+            requests = [(f'method="{_label(method)}",route="{_label(route)}",status="{status}"', histogram)
+                        for (method, route, status), histogram in sorted(self.requests.items())]
+            statements = [(f'statement="{_label(label)}"', histogram)
+                          for label, histogram in sorted(self.statements.items())]
+            rows = sorted(self.rows.items())
+        lines = [
+            "# HELP smarthouse_http_request_duration_seconds Time spent answering API requests.",
+            "# TYPE smarthouse_http_request_duration_seconds histogram",
+        ]
+        lines += self._histogram_lines("smarthouse_http_request_duration_seconds", requests)
+        lines += [
+            "# HELP smarthouse_sql_statement_duration_seconds Time spent executing SQL statements and fetching their rows.",
+            "# TYPE smarthouse_sql_statement_duration_seconds histogram",
+        ]
+        lines += self._histogram_lines("smarthouse_sql_statement_duration_seconds", statements)
+        lines += [
+            "# HELP smarthouse_sql_statement_rows_total Rows returned or changed by SQL statements.",
+            "# TYPE smarthouse_sql_statement_rows_total counter",
+        ]
+        lines += [f'smarthouse_sql_statement_rows_total{{statement="{_label(label)}"}} {count}' for label, count in rows]
+        for name, value in (gauges or {}).items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class TracingCursor(sqlite3.Cursor):
+    """
+    SQLite cursor that times every statement, from `execute` until its rows are
+    fetched, and counts the rows it returned (or changed, for INSERT/UPDATE/DELETE).
+    A statement is recorded when the next one is executed or the cursor is closed.
+    """
+
+    def __init__(self, connection: sqlite3.Connection, metrics: Metrics) -> None:
+        super().__init__(connection)
+        self.metrics = metrics
+        self.statement = None
+        self.seconds = 0.0
+        self.fetched = 0
+
+    def _finish(self):
+        if self.statement is not None:
+            rows = self.fetched + max(self.rowcount, 0)
+            self.metrics.observe_statement(self.statement, self.seconds, rows)
+            self.statement = None
+
+    def _run(self, method, sql, parameters):
+        self._finish()
+        start = perf_counter()
+        method(sql, parameters)
+        self.seconds = perf_counter() - start
+        self.fetched = 0
+        self.statement = sql
+        return self
+
+    def execute(self, sql, parameters = ()):
+        return self._run(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(super().executemany, sql, seq_of_parameters)
+
+    def fetchone(self):
+        start = perf_counter()
+        row = super().fetchone()
+        self.seconds += perf_counter() - start
+        if row is not None:
+            self.fetched += 1
+        return row
+
+    def fetchmany(self, size = None):
+        start = perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self.seconds += perf_counter() - start
+        self.fetched += len(rows)
+        return rows
+
+    def fetchall(self):
+        start = perf_counter()
+        rows = super().fetchall()
+        self.seconds += perf_counter() - start
+        self.fetched += len(rows)
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the duration of every HTTP request, labelled with
+    the route template (e.g. `/smarthouse/device/{uuid}`) and the response status.
+    Streaming responses are measured until their last chunk has been sent.
+    """
+
+    def __init__(self, app, metrics: Metrics) -> None:
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.metrics.enabled:
+            return await self.app(scope, receive, send)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            # ruten settes av routeren, f.eks. /smarthouse/device/{uuid}
+            route = getattr(scope.get("route"), "path", "unmatched")
+            self.metrics.observe_request(scope["method"], route, status, perf_counter() - start)
@@ -3,9 +3,326 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
+import os
 import sqlite3
+import threading
+from array import array
+from bisect import insort
+from datetime import date as date_type, timedelta
 from typing import Optional
-from smarthouse.domain import Measurement, SmartHouse, Aktuator, Sensor, Floor
+from smarthouse.domain import Measurement, MeasurementSeries, SmartHouse, Aktuator, Sensor, to_epoch, from_epoch
+from smarthouse.pool import ConnectionPool
+from smarthouse.downsampling import downsample, LTTB
+from smarthouse.snapshot import write_snapshot, read_snapshot, SnapshotError
+
+def normalize_unit(unit):
+    """
+    Turns a raw unit value from the database into the unit string used by
+    the domain model.
+    """
+    if unit is None:
+        return None
+    if isinstance(unit, bytes):
+        unit = unit.decode("utf-8")
+    unit = unit.strip()
+    # Hvis enheten er "°C", kan vi spesifisere at den håndteres annerledes, om nødvendig
+    if unit == "°C":
+        unit = "grader Celsius"
+    return unit
+
+
+# Schema changes applied on top of the original database, in order. The number of
+# applied migrations is kept in `PRAGMA user_version`.
+MIGRATIONS = [
+    # 1: indexes for the measurement hot path, so lookups per device/unit and
+    # time range are index searches instead of full table scans
+    """
+    CREATE INDEX IF NOT EXISTS idx_measurements_device_ts ON measurements (device, ts);
+    CREATE INDEX IF NOT EXISTS idx_measurements_unit_ts ON measurements (unit, ts);
+    CREATE INDEX IF NOT EXISTS idx_devices_room ON devices (room);
+    CREATE INDEX IF NOT EXISTS idx_rooms_name ON rooms (name);
+    """,
+    # 2: hourly and daily rollups per device and unit, kept up to date by triggers
+    # on every insert (and delete) of a measurement and backfilled from existing rows
+    """
+    CREATE TABLE IF NOT EXISTS measurements_hourly (
+        device TEXT NOT NULL, unit TEXT NOT NULL, bucket TEXT NOT NULL,
+        count INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL,
+        PRIMARY KEY (device, unit, bucket)
+    );
+    CREATE TABLE IF NOT EXISTS measurements_daily (
+        device TEXT NOT NULL, unit TEXT NOT NULL, bucket TEXT NOT NULL,
+        count INTEGER NOT NULL, sum REAL NOT NULL, min REAL NOT NULL, max REAL NOT NULL,
+        PRIMARY KEY (device, unit, bucket)
+    );
+    INSERT OR REPLACE INTO measurements_hourly
+        SELECT device, IFNULL(unit, ''), substr(ts, 1, 13), COUNT(*), SUM(value), MIN(value), MAX(value)
+        FROM measurements GROUP BY 1, 2, 3;
+    INSERT OR REPLACE INTO measurements_daily
+        SELECT device, IFNULL(unit, ''), substr(ts, 1, 10), COUNT(*), SUM(value), MIN(value), MAX(value)
+        FROM measurements GROUP BY 1, 2, 3;
+    CREATE TRIGGER IF NOT EXISTS trg_measurements_rollup_insert AFTER INSERT ON measurements
+    BEGIN
+        INSERT INTO measurements_hourly VALUES
+            (NEW.device, IFNULL(NEW.unit, ''), substr(NEW.ts, 1, 13), 1, NEW.value, NEW.value, NEW.value)
+        ON CONFLICT (device, unit, bucket) DO UPDATE SET
+            count = count + 1, sum = sum + excluded.sum, min = MIN(min, excluded.min), max = MAX(max, excluded.max);
+        INSERT INTO measurements_daily VALUES
+            (NEW.device, IFNULL(NEW.unit, ''), substr(NEW.ts, 1, 10), 1, NEW.value, NEW.value, NEW.value)
+        ON CONFLICT (device, unit, bucket) DO UPDATE SET
+            count = count + 1, sum = sum + excluded.sum, min = MIN(min, excluded.min), max = MAX(max, excluded.max);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_measurements_rollup_delete AFTER DELETE ON measurements
+    BEGIN
+        DELETE FROM measurements_hourly
+        WHERE device = OLD.device AND unit = IFNULL(OLD.unit, '') AND bucket = substr(OLD.ts, 1, 13);
+        INSERT INTO measurements_hourly
+            SELECT device, IFNULL(unit, ''), substr(ts, 1, 13), COUNT(*), SUM(value), MIN(value), MAX(value)
+            FROM measurements
+            WHERE device = OLD.device AND IFNULL(unit, '') = IFNULL(OLD.unit, '')
+              AND ts >= substr(OLD.ts, 1, 13) AND ts < substr(OLD.ts, 1, 13) || ';'
+            GROUP BY 1, 2, 3;
+        DELETE FROM measurements_daily
+        WHERE device = OLD.device AND unit = IFNULL(OLD.unit, '') AND bucket = substr(OLD.ts, 1, 10);
+        INSERT INTO measurements_daily
+            SELECT device, IFNULL(unit, ''), substr(ts, 1, 10), COUNT(*), SUM(value), MIN(value), MAX(value)
+            FROM measurements
+            WHERE device = OLD.device AND IFNULL(unit, '') = IFNULL(OLD.unit, '')
+              AND ts >= substr(OLD.ts, 1, 10) AND ts < substr(OLD.ts, 1, 10) || '~'
+            GROUP BY 1, 2, 3;
+    END;
+    """,
+    # 3: the per-row triggers made every insert three writes. The rollups are now
+    # brought up to date in bulk from the rows added since the rowid watermark in
+    # `rollup_state` (see `refresh_rollups`); after deletes `rebuild_rollups` is used
+    """
+    DROP TRIGGER IF EXISTS trg_measurements_rollup_insert;
+    DROP TRIGGER IF EXISTS trg_measurements_rollup_delete;
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1), last_rowid INTEGER NOT NULL
+    );
+    INSERT OR REPLACE INTO rollup_state SELECT 1, IFNULL(MAX(rowid), 0) FROM measurements;
+    """,
+    # 4: change log for rooms, devices and actuator states, so a loaded house can be
+    # brought up to date from the changes after its high-water mark (see `fetch_changes`).
+    # New measurements are found by rowid and need no log
+    """
+    CREATE TABLE IF NOT EXISTS sync_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT, entity TEXT NOT NULL, key NOT NULL
+    );
+    CREATE TRIGGER IF NOT EXISTS trg_rooms_sync_insert AFTER INSERT ON rooms
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('room', NEW.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rooms_sync_update AFTER UPDATE ON rooms
+    BEGIN
+        INSERT INTO sync_log (entity, key) SELECT 'room', OLD.id UNION SELECT 'room', NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_rooms_sync_delete AFTER DELETE ON rooms
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('room', OLD.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_devices_sync_insert AFTER INSERT ON devices
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('device', NEW.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_devices_sync_update AFTER UPDATE ON devices
+    BEGIN
+        INSERT INTO sync_log (entity, key) SELECT 'device', OLD.id UNION SELECT 'device', NEW.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_devices_sync_delete AFTER DELETE ON devices
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('device', OLD.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_state_sync_insert AFTER INSERT ON ActuatorState
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('device', NEW.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_state_sync_update AFTER UPDATE OF state ON ActuatorState
+    WHEN OLD.state IS NOT NEW.state
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('device', NEW.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS trg_state_sync_delete AFTER DELETE ON ActuatorState
+    BEGIN
+        INSERT INTO sync_log (entity, key) VALUES ('device', OLD.id);
+    END;
+    """,
+]
+
+# adds already aggregated (device, unit, bucket, count, sum, min, max) rows to a rollup table
+ROLLUP_MERGE = """
+    INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (device, unit, bucket) DO UPDATE SET
+        count = count + excluded.count, sum = sum + excluded.sum,
+        min = MIN(min, excluded.min), max = MAX(max, excluded.max)
+"""
+
+# adds the measurements with rowid in (?, ?] to a rollup table
+ROLLUP_UPSERT = """
+    INSERT INTO {table}
+        SELECT device, IFNULL(unit, ''), substr(ts, 1, {length}), COUNT(*), SUM(value), MIN(value), MAX(value)
+        FROM measurements WHERE rowid > ? AND rowid <= ? GROUP BY 1, 2, 3
+    ON CONFLICT (device, unit, bucket) DO UPDATE SET
+        count = count + excluded.count, sum = sum + excluded.sum,
+        min = MIN(min, excluded.min), max = MAX(max, excluded.max)
+"""
+
+
+def next_day(date: str) -> str:
+    """
+    Returns the ISO date following the given ISO date.
+    """
+    return (date_type.fromisoformat(date) + timedelta(days=1)).isoformat()
+
+
+def previous_day(date: str) -> str:
+    """
+    Returns the ISO date preceding the given ISO date.
+    """
+    return (date_type.fromisoformat(date) - timedelta(days=1)).isoformat()
+
+
+class LazyMeasurementHistory:
+    """
+    A read-only, paged view on the measurements of one device that fetches
+    rows from the repository on demand instead of holding them in memory.
+    It supports `len()`, indexing, slicing and iteration like the list it
+    replaces. Measurements appended in memory are kept after the stored ones.
+    """
+
+    def __init__(self, repo, device_id, page_size = 1000):
+        self.repo = repo
+        self.device_id = device_id
+        self.page_size = page_size
+        self.pending = []
+
+    def _measurement(self, row):
+        return Measurement(str(row[0]), float(row[1]), self.repo.unit(row[2]))
+
+    def _stored_count(self):
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM measurements WHERE device = ?", (self.device_id,))
+            return cursor.fetchone()[0]
+
+    def page(self, offset, limit):
+        """
+        Returns up to `limit` stored measurements starting at position `offset`
+        in timestamp order.
+        """
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT ts, value, unit FROM measurements
+                           WHERE device = ? ORDER BY ts, rowid LIMIT ? OFFSET ?
+                           """, (self.device_id, limit, offset))
+            rows = cursor.fetchall()
+        return [self._measurement(row) for row in rows]
+
+    def last(self):
+        if self.pending:
+            return self.pending[-1]
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT ts, value, unit FROM measurements
+                           WHERE device = ? ORDER BY ts DESC, rowid DESC LIMIT 1
+                           """, (self.device_id,))
+            row = cursor.fetchone()
+        return self._measurement(row) if row else None
+
+    def append(self, measurement):
+        # holdes sortert på tid, som de lagrede målingene
+        insort(self.pending, measurement, key=lambda m: to_epoch(m.timestamp))
+
+    def _pending_between(self, start, end):
+        return [m for m in self.pending
+                if (start is None or to_epoch(m.timestamp) >= start) and (end is None or to_epoch(m.timestamp) <= end)]
+
+    def between(self, start = None, end = None):
+        """
+        Returns the measurements from `start` to `end` (both included),
+        using the (device, ts) index of the database.
+        """
+        start = None if start is None else to_epoch(start)
+        end = None if end is None else to_epoch(end)
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT ts, value, unit FROM measurements
+                           WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts, rowid
+                           """, (self.device_id, "" if start is None else from_epoch(start),
+                                 "9999" if end is None else from_epoch(end)))
+            rows = cursor.fetchall()
+        return [self._measurement(row) for row in rows] + self._pending_between(start, end)
+
+    def at_or_before(self, timestamp):
+        """
+        Returns the latest measurement taken at or before `timestamp`, or None.
+        """
+        epoch = to_epoch(timestamp)
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT ts, value, unit FROM measurements
+                           WHERE device = ? AND ts <= ? ORDER BY ts DESC, rowid DESC LIMIT 1
+                           """, (self.device_id, from_epoch(epoch)))
+            row = cursor.fetchone()
+        stored = self._measurement(row) if row else None
+        pending = self._pending_between(None, epoch)
+        if pending and (stored is None or to_epoch(pending[-1].timestamp) >= to_epoch(stored.timestamp)):
+            return pending[-1]
+        return stored
+
+    def window(self, timestamp, seconds):
+        end = to_epoch(timestamp)
+        return self.between(end - seconds, end)
+
+    def __len__(self):
+        return self._stored_count() + len(self.pending)
+
+    def __bool__(self):
+        return self.last() is not None
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                # henter det sammenhengende området i stigende rekkefølge og plukker ut posisjonene
+                positions = range(start, stop, step)
+                if not positions:
+                    return []
+                low = min(positions[0], positions[-1])
+                rows = self[low:max(positions[0], positions[-1]) + 1]
+                return [rows[i - low] for i in positions]
+            stored = self._stored_count()
+            result = self.page(start, max(0, min(stop, stored) - start)) if start < stored else []
+            return result + self.pending[max(0, start - stored):max(0, stop - stored)]
+        if index == -1:
+            last = self.last()
+            if last is None:
+                raise IndexError("measurement index out of range")
+            return last
+        size = len(self)
+        if index < 0:
+            index += size
+        if index < 0 or index >= size:
+            raise IndexError("measurement index out of range")
+        stored = size - len(self.pending)
+        if index >= stored:
+            return self.pending[index - stored]
+        return self.page(index, 1)[0]
+
+    def __iter__(self):
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT ts, value, unit FROM measurements
+                           WHERE device = ? ORDER BY ts, rowid
+                           """, (self.device_id,))
+            while True:
+                rows = cursor.fetchmany(self.page_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield self._measurement(row)
+        yield from list(self.pending)
+
 
 class SmartHouseRepository:
     """
@@ -13,12 +330,50 @@ class SmartHouseRepository:
     in a SQLite database.
     """
 
-    def __init__(self, file: str) -> None:
+    # number of rows fetched per round trip when streaming large tables
+    FETCH_SIZE = 10000
+    # number of rows per executemany call when ingesting measurements
+    INGEST_BATCH_SIZE = 10000
+
+    # WAL lets readers run while a batch is written, and with WAL synchronous=NORMAL
+    # only syncs at checkpoints instead of at every commit
+    PRAGMAS = [
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -65536",
+    ]
+
+    def __init__(self, file: str, readers: int = 4) -> None:
         self.file = file 
-        self.conn = sqlite3.connect(file, check_same_thread=False)
+        self.readers = readers
+        self.cursor_factory = sqlite3.Cursor
+        self.pool = ConnectionPool(self.connect, readers)
+        self.units = {}
+        # holdes mens målinger legges til husene i minnet, se ingest_measurements og apply_changes
+        self.memory_lock = threading.Lock()
+        self.listeners = []
+        self.migrate()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """
+        The writer connection of the pool.
+        """
+        return self.pool.writer
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        Opens a new connection to the database file with the pragmas of this repository applied.
+        """
+        conn = sqlite3.connect(self.file, check_same_thread=False)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
 
     def __del__(self):
-        self.conn.close()
+        if hasattr(self, "pool"):
+            self.pool.close()
 
     def cursor(self) -> sqlite3.Cursor:
         """
@@ -27,89 +382,154 @@ class SmartHouseRepository:
         rememeber calling `commit/rollback` and `close` yourself when
         you are done with issuing SQL commands.
         """
-        return self.conn.cursor()
+        return self.conn.cursor(self.cursor_factory)
+
+    def read_cursor(self):
+        """
+        Context manager providing a cursor on one of the pooled read-only
+        connections; the cursor is closed and the connection returned afterwards.
+        """
+        return self.pool.read_cursor()
+
+    def write_cursor(self):
+        """
+        Context manager providing a cursor on the writer connection; the
+        transaction is committed at the end or rolled back on errors.
+        """
+        return self.pool.write_cursor()
+
+    def add_listener(self, listener):
+        """
+        Registers a callable `listener(kind, changes)` that is called after every
+        committed write: kind "measurement" with the latest (device, timestamp, value, unit)
+        row per device and unit of an ingestion, kind "actuator" with (device, state) pairs.
+        It is called on the writing thread and should return quickly.
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self, kind, changes):
+        for listener in self.listeners:
+            listener(kind, changes)
+
+    def schema_version(self) -> int:
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def migrate(self):
+        """
+        Brings the database schema up to date by applying all migrations
+        that have not been applied to this database yet.
+        """
+        version = self.schema_version()
+        for number, script in enumerate(MIGRATIONS[version:], start=version + 1):
+            self.conn.executescript(f"BEGIN; {script} PRAGMA user_version = {number}; COMMIT;")
 
     def reconnect(self):
-        self.conn.close()
-        self.conn = sqlite3.connect(self.file)
+        self.pool.close()
+        self.pool = ConnectionPool(self.connect, self.readers, cursor_factory=self.cursor_factory)
+
+    def trace(self, metrics = None):
+        """
+        Creates all cursors of this repository with the cursor factory of the given
+        `Metrics`, so every statement is timed and its rows counted.
+        `trace(None)` goes back to plain SQLite cursors.
+        """
+        self.cursor_factory = sqlite3.Cursor if metrics is None else metrics.cursor
+        self.pool.cursor_factory = self.cursor_factory
 
     
-    def load_smarthouse_deep(self):
+    def unit(self, raw_unit):
+        """
+        Returns the normalized unit for a raw unit value, decoding each
+        distinct value only once.
+        """
+        if raw_unit not in self.units:
+            self.units[raw_unit] = normalize_unit(raw_unit)
+        return self.units[raw_unit]
+
+    def load_smarthouse_deep(self, lazy = False):
         """
         This method retrives the complete single instance of the _SmartHouse_ 
         object stored in this database. The retrieval yields a _deep_ copy, i.e.
         all referenced objects within the object structure (e.g. floors, rooms, devices) 
         are retrieved as well.
+        With `lazy=True` only the house structure is loaded and the measurement
+        history of each device is a `LazyMeasurementHistory` reading from the database.
         """
         # Smarthouse
         HOUSE = SmartHouse()
 
-        cursor = self.conn.cursor()
+        with self.read_cursor() as cursor:
+            self._load_house(HOUSE, cursor, lazy)
+        return HOUSE
 
-        # Floor
-        cursor.execute("SELECT floor FROM rooms group by floor")
-        for row in cursor.fetchall():
-            floor_value = int(row[0])
-            floor = Floor(floor_value)
-            HOUSE.register_floor(floor)
-     
-        # Room
-        cursor.execute("SELECT floor, area, name FROM  rooms")
-        floors_in_house = HOUSE.get_floors()
-        for row in cursor.fetchall():
-            for floor_h in floors_in_house:
-                if floor_h.get_level().level == int(row[0]):
-                    HOUSE.register_room(floor_h, row[1], row[2])
-
-                
-        # Device
-        cursor.execute("SELECT r.name, d.id, d.supplier, d.product, d.kind, d.category FROM devices AS d INNER JOIN rooms AS r ON d.room = r.id")
-        rooms = HOUSE.get_rooms()
-        for row in cursor.fetchall():
-            for room in rooms:
-                if(row[0].lower() == room.room_name.lower()):
-                    if(row[5].strip().lower() == "actuator"):
-                        device = Aktuator(row[1], row[2], row[3], row[4])
-                        HOUSE.register_device(room,device)
-                    else:
-                        device = Sensor(row[1], row[2], row[3], row[4])
-                        HOUSE.register_device(room,device)
+    def _device(self, id, supplier, product, kind, category, state):
+        if category.strip().lower() == "actuator":
+            device = Aktuator(id, supplier, product, kind)
+            if state is not None:
+                device.state = state
+        else:
+            device = Sensor(id, supplier, product, kind)
+        return device
 
-        
-        # Measurement
-        cursor.execute("SELECT device, ts, value, unit FROM measurements")
-        teller = 0
-        for row in cursor.fetchall():
-            device = HOUSE.get_device_by_id(row[0])
-            if device:
-                unit = row[3]
-                
-                # Sjekk enheten før videre behandling
-                #print("Enhet før behandling:", unit)
-                
-                if isinstance(unit, bytes):
-                    unit = unit.decode("utf-8")
-                
-                unit = unit.strip()
-                
-                # Hvis enheten er "°C", kan vi spesifisere at den håndteres annerledes, om nødvendig
-                if unit == "°C":
-                    unit = "grader Celsius"
-                
-                # Lag måling
-                measurement = Measurement(str(row[1]), float(row[2]), unit)
-                device.add_measurement_known(measurement)
-                teller += 1
-
-
-
-        # ActuatorState
-        cursor.execute("SELECT id, state FROM ActuatorState")
+    def _load_house(self, HOUSE, cursor, lazy):
+        # alt leses i én transaksjon, slik at høyvannsmerkene passer til det som lastes
+        cursor.execute("BEGIN")
+        cursor.execute("SELECT IFNULL(MAX(seq), 0) FROM sync_log")
+        HOUSE.synced_seq = cursor.fetchone()[0]
+        cursor.execute("SELECT IFNULL(MAX(rowid), 0) FROM measurements")
+        HOUSE.synced_rowid = cursor.fetchone()[0]
+
+        # Floor, Room, Device og ActuatorState i én spørring, sortert slik at
+        # hver etasje og hvert rom bare registreres én gang
+        cursor.execute("""
+                       SELECT r.id, r.floor, r.area, r.name,
+                              d.id, d.supplier, d.product, d.kind, d.category, s.state
+                       FROM rooms r
+                       LEFT JOIN devices d ON d.room = r.id
+                       LEFT JOIN ActuatorState s ON s.id = d.id
+                       ORDER BY r.floor, r.id
+                       """)
+        devices = {}
+        room = None
         for row in cursor.fetchall():
-            device = HOUSE.get_device_by_id(row[0])
-            device.state = row[1]
+            if room is None or room.room_id != row[0]:
+                floor = HOUSE.get_floor(int(row[1]))
+                if floor is None:
+                    floor = HOUSE.register_floor(int(row[1]))
+                room = HOUSE.register_room(floor, row[2], row[3], row[0])
+            if row[4] is None:
+                continue
+            device = self._device(*row[4:])
+            HOUSE.register_device(room, device)
+            devices[device.id] = device
 
-        return HOUSE
+        if lazy:
+            for device in devices.values():
+                device.measurement_history = LazyMeasurementHistory(self, device.id)
+            return
+
+        # Measurement, hentet i porsjoner så vi slipper å holde hele tabellen i minnet
+        # SQLite regner om tidsstempelet til epoch-sekunder for oss
+        cursor.execute("SELECT device, CAST(strftime('%s', ts) AS INTEGER), value, unit, ts FROM measurements WHERE rowid <= ?",
+                       (HOUSE.synced_rowid,))
+        units = self.units
+        while True:
+            rows = cursor.fetchmany(self.FETCH_SIZE)
+            if not rows:
+                break
+            for device_id, epoch, value, unit, ts in rows:
+                device = devices.get(device_id)
+                if device:
+                    if unit in units:
+                        unit = units[unit]
+                    else:
+                        unit = self.unit(unit)
+                    if epoch is None:
+                        epoch = to_epoch(ts)
+                    device.measurement_history.add(epoch, float(value), unit)
 
     def get_latest_reading(self, sensor) -> Optional[Measurement]:
         """
@@ -124,14 +544,560 @@ class SmartHouseRepository:
         """
         Saves the state of the given actuator in the database. 
         """
-        cursor = self.conn.cursor()
-        new_state = 1 if actuator.is_active() else 0
-        cursor.execute("UPDATE ActuatorState SET state = ? WHERE id = ?;", (new_state, actuator.id))
-        self.conn.commit()
-        cursor.close()
+        self.update_actuator_states([actuator])
+
+    def update_actuator_states(self, actuators):
+        """
+        Saves the states of many actuators, e.g. all lights of a scene, in a single
+        transaction with `executemany`. Returns the number of saved states.
+        """
+        states = [(1 if actuator.is_active() else 0, actuator.id) for actuator in actuators]
+        if not states:
+            return 0
+        with self.write_cursor() as cursor:
+            cursor.executemany("UPDATE ActuatorState SET state = ? WHERE id = ?;", states)
+        self._notify("actuator", [(device_id, state) for state, device_id in states])
+        return len(states)
+
+    def _refresh_rollups(self, cursor):
+        cursor.execute("SELECT last_rowid FROM rollup_state WHERE id = 1")
+        last_rowid = cursor.fetchone()[0]
+        cursor.execute("SELECT IFNULL(MAX(rowid), 0) FROM measurements")
+        newest_rowid = cursor.fetchone()[0]
+        if newest_rowid > last_rowid:
+            for table, length in (("measurements_hourly", 13), ("measurements_daily", 10)):
+                cursor.execute(ROLLUP_UPSERT.format(table=table, length=length), (last_rowid, newest_rowid))
+            cursor.execute("UPDATE rollup_state SET last_rowid = ? WHERE id = 1", (newest_rowid,))
+        return newest_rowid
+
+    def refresh_rollups(self):
+        """
+        Adds all measurements stored since the last refresh to the hourly and daily
+        rollups. Runs before every rollup query, so rows inserted by any writer are counted.
+        """
+        # sjekker først uten skrivelåsen, som regel er det ingenting nytt
+        with self.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT (SELECT last_rowid FROM rollup_state WHERE id = 1)
+                                < (SELECT IFNULL(MAX(rowid), 0) FROM measurements)
+                           """)
+            if not cursor.fetchone()[0]:
+                return
+        with self.write_cursor() as cursor:
+            if not cursor.connection.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            self._refresh_rollups(cursor)
+
+    def rebuild_rollups(self, device_id: Optional[str] = None):
+        """
+        Recomputes the hourly and daily rollups from the raw measurements, for one
+        device or for all of them. Needed after measurements have been deleted or changed.
+        Since such changes are not visible to the snapshot validation, the snapshot is removed.
+        """
+        self.refresh_rollups()
+        where, params = ("WHERE device = ?", (device_id,)) if device_id is not None else ("", ())
+        with self.write_cursor() as cursor:
+            for table, length in (("measurements_hourly", 13), ("measurements_daily", 10)):
+                cursor.execute(f"DELETE FROM {table} {where}", params)
+                cursor.execute(f"""
+                               INSERT INTO {table}
+                               SELECT device, IFNULL(unit, ''), substr(ts, 1, {length}), COUNT(*), SUM(value), MIN(value), MAX(value)
+                               FROM measurements {where} GROUP BY 1, 2, 3
+                               """, params)
+            cursor.execute("UPDATE rollup_state SET last_rowid = (SELECT IFNULL(MAX(rowid), 0) FROM measurements) WHERE id = 1")
+        if os.path.exists(self.snapshot_path()):
+            os.remove(self.snapshot_path())
+
+    # snapshots
+
+    def snapshot_path(self) -> str:
+        return f"{self.file}.snapshot"
+
+    def save_snapshot(self, house: SmartHouse, path = None):
+        """
+        Writes a binary snapshot of the given house (see `snapshot`), stamped with the
+        schema version and the high-water marks the house is synchronised to.
+        Measurement columns are included unless the house uses lazy histories.
+        """
+        measurements = all(isinstance(device.measurement_history, MeasurementSeries) for device in house.get_devices())
+        write_snapshot(house, path or self.snapshot_path(), self.schema_version(), measurements)
+
+    def load_snapshot(self, path = None, lazy = False) -> Optional[SmartHouse]:
+        """
+        Reads the house from a snapshot and validates it against the database: the schema
+        version must match and the database must not be behind the snapshot. Changes made
+        after the snapshot was written are fetched and applied incrementally.
+        Returns None if there is no usable snapshot.
+        """
+        return self._load_snapshot(path or self.snapshot_path(), lazy)[0]
+
+    def _load_snapshot(self, path, lazy):
+        try:
+            schema_version, house = read_snapshot(path, measurements=not lazy)
+        except (OSError, SnapshotError):
+            return None, False
+        if schema_version != self.schema_version():
+            return None, False
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT (SELECT IFNULL(MAX(seq), 0) FROM sync_log), (SELECT IFNULL(MAX(rowid), 0) FROM measurements)")
+            seq, rowid = cursor.fetchone()
+        # en database som er eldre enn snapshotet er byttet ut eller rullet tilbake
+        if house.synced_seq > seq or house.synced_rowid > rowid:
+            return None, False
+        if lazy:
+            for device in house.get_devices():
+                device.measurement_history = LazyMeasurementHistory(self, device.id)
+        if (house.synced_seq, house.synced_rowid) == (seq, rowid):
+            return house, True
+        self.apply_changes(house, self.fetch_changes(house, lazy), lazy)
+        return house, False
+
+    def load_smarthouse_cached(self, lazy = False, path = None) -> SmartHouse:
+        """
+        Like `load_smarthouse_deep`, but starts from the snapshot if there is a usable one
+        and only falls back to loading everything with SQL if not. The snapshot is
+        rewritten when it was missing or out of date.
+        """
+        path = path or self.snapshot_path()
+        house, up_to_date = self._load_snapshot(path, lazy)
+        if house is None:
+            house = self.load_smarthouse_deep(lazy)
+        if not up_to_date:
+            self.save_snapshot(house, path)
+        return house
+
+    # synchronisation
+
+    def fetch_changes(self, house: SmartHouse, lazy = False) -> dict:
+        """
+        Reads everything that changed in the database after the high-water marks of the
+        given house: rooms and devices (including actuator states) logged in `sync_log`
+        after `house.synced_seq` and measurements with a rowid above `house.synced_rowid`.
+        Only reads from the database, the result is applied with `apply_changes`.
+        With `lazy=True` no measurements are fetched since lazy histories read them directly.
+        """
+        with self.read_cursor() as cursor:
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT IFNULL(MAX(seq), 0) FROM sync_log")
+            seq = cursor.fetchone()[0]
+            cursor.execute("SELECT IFNULL(MAX(rowid), 0) FROM measurements")
+            rowid = cursor.fetchone()[0]
+            changes = {"seq": seq, "rowid": rowid, "rooms": {}, "devices": {}, "histories": {}, "measurements": []}
+
+            cursor.execute("SELECT DISTINCT entity, key FROM sync_log WHERE seq > ? AND seq <= ?", (house.synced_seq, seq))
+            keys = {"room": [], "device": []}
+            for entity, key in cursor.fetchall():
+                keys[entity].append(key)
+            for room_id in keys["room"]:
+                cursor.execute("SELECT floor, area, name FROM rooms WHERE id = ?", (room_id,))
+                changes["rooms"][room_id] = cursor.fetchone()
+            for device_id in keys["device"]:
+                cursor.execute("""
+                               SELECT d.room, d.supplier, d.product, d.kind, d.category, s.state
+                               FROM devices d LEFT JOIN ActuatorState s ON s.id = d.id
+                               WHERE d.id = ?
+                               """, (device_id,))
+                changes["devices"][device_id] = cursor.fetchone()
+
+            if lazy:
+                return changes
+            # nye enheter får hele historikken sin her, alle andre bare de nye radene
+            new_devices = {device_id for device_id, row in changes["devices"].items()
+                           if row is not None and house.get_device_by_id(device_id) is None}
+            for device_id in new_devices:
+                cursor.execute("""
+                               SELECT CAST(strftime('%s', ts) AS INTEGER), value, unit, ts FROM measurements
+                               WHERE device = ? AND rowid <= ? ORDER BY rowid
+                               """, (device_id, rowid))
+                changes["histories"][device_id] = cursor.fetchall()
+            cursor.execute("""
+                           SELECT rowid, device, CAST(strftime('%s', ts) AS INTEGER), value, unit, ts FROM measurements
+                           WHERE rowid > ? AND rowid <= ?
+                           """, (house.synced_rowid, rowid))
+            while True:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+                if not rows:
+                    break
+                changes["measurements"].extend(row for row in rows if row[1] not in new_devices)
+        return changes
+
+    def apply_changes(self, house: SmartHouse, changes: dict, lazy = False):
+        """
+        Patches the given house in place with the changes read by `fetch_changes`:
+        rooms and devices are added, updated, moved or removed, actuator states are
+        set and new measurements are appended to the in-memory histories.
+        Afterwards the high-water marks of the house point to the fetched state.
+        """
+        with self.memory_lock:
+            rooms = changes["rooms"]
+            for room_id, row in rooms.items():
+                if row is None:
+                    continue
+                level, area, name = row
+                floor = house.get_floor(int(level))
+                if floor is None:
+                    floor = house.register_floor(int(level))
+                    house.floors.sort(key=lambda floor: floor.level)
+                room = house.get_room_by_id(room_id)
+                if room is None:
+                    house.register_room(floor, area, name, room_id)
+                else:
+                    house.update_room(room, floor, area, name)
+
+            for device_id, row in changes["devices"].items():
+                device = house.get_device_by_id(device_id)
+                if row is None:
+                    if device is not None:
+                        device.room.remove_device(device)
+                    continue
+                room = house.get_room_by_id(row[0])
+                if room is None:
+                    continue
+                updated = self._device(device_id, *row[1:])
+                if device is None or type(device) is not type(updated):
+                    if device is not None:
+                        updated.measurement_history = device.measurement_history
+                        device.room.remove_device(device)
+                    elif lazy:
+                        updated.measurement_history = LazyMeasurementHistory(self, device_id)
+                    else:
+                        history = updated.measurement_history
+                        for epoch, value, unit, ts in changes["histories"].get(device_id, ()):
+                            history.add(epoch if epoch is not None else to_epoch(ts), float(value), self.unit(unit))
+                    house.register_device(room, updated)
+                    continue
+                device.supplier = updated.supplier
+                device.model_name = updated.model_name
+                device.device_type = updated.device_type
+                if isinstance(device, Aktuator):
+                    device.state = updated.state
+                if device.room is not room:
+                    house.register_device(room, device)
+
+            # rom som er slettet fjernes til slutt, etter at enhetene er flyttet ut
+            for room_id, row in rooms.items():
+                room = house.get_room_by_id(room_id)
+                if row is None and room is not None:
+                    house.remove_room(room)
+
+            for rowid, device_id, epoch, value, unit, ts in changes["measurements"]:
+                # raden kan allerede være lagt til av ingest_measurements
+                if rowid <= house.synced_rowid:
+                    continue
+                device = house.get_device_by_id(device_id)
+                if device is not None and isinstance(device.measurement_history, MeasurementSeries):
+                    device.measurement_history.add(epoch if epoch is not None else to_epoch(ts), float(value), self.unit(unit))
+
+            house.synced_seq = max(house.synced_seq, changes["seq"])
+            house.synced_rowid = max(house.synced_rowid, changes["rowid"])
+
+    # ingestion
+
+    def ingest_measurements(self, readings, house: Optional[SmartHouse] = None, batch_size: Optional[int] = None) -> int:
+        """
+        Stores many measurements at once. `readings` is an iterable of
+        (device, timestamp, value, unit) tuples, where device is a device object or
+        a device id and timestamp a `datetime`, epoch seconds or an ISO 8601 string.
+        All rows are written with `executemany` in a single transaction. If a house is
+        given, the readings are appended to the in-memory history of its devices as well
+        (lazy histories read from the database and need no update), provided the house is
+        up to date with the database; otherwise the next `apply_changes` picks them up.
+        Returns the number of stored measurements.
+        """
+        batch_size = batch_size or self.INGEST_BATCH_SIZE
+        sql = "INSERT INTO measurements (device, ts, value, unit) VALUES (?, ?, ?, ?)"
+        count = 0
+        batch = []
+        in_memory = []
+        histories = {}
+        # rollupene for denne transaksjonen summeres her i stedet for i SQL etterpå
+        hourly = {}
+        # siste måling per enhet og måleenhet, bare når noen lytter
+        latest = {} if self.listeners else None
+        with self.write_cursor() as cursor:
+            if not cursor.connection.in_transaction:
+                cursor.execute("BEGIN IMMEDIATE")
+            # rader fra andre skrivere må med i rollupene før vi flytter vannmerket
+            first_rowid = self._refresh_rollups(cursor)
+            for device, ts, value, unit in readings:
+                device_id = device if isinstance(device, str) else device.id
+                value = float(value)
+                # lagres alltid som "YYYY-MM-DD HH:MM:SS", ellers treffer ikke tekstsammenligningene i spørringene
+                if not (isinstance(ts, str) and len(ts) == 19 and ts[10] == " "):
+                    ts = from_epoch(to_epoch(ts))
+                batch.append((device_id, ts, value, unit))
+                if latest is not None:
+                    previous = latest.get((device_id, unit))
+                    if previous is None or ts >= previous[0]:
+                        latest[(device_id, unit)] = (ts, value)
+                key = (device_id, unit or "", ts[:13])
+                bucket = hourly.get(key)
+                if bucket is None:
+                    hourly[key] = [1, value, value, value]
+                else:
+                    bucket[0] += 1
+                    bucket[1] += value
+                    if value < bucket[2]:
+                        bucket[2] = value
+                    elif value > bucket[3]:
+                        bucket[3] = value
+                if house is not None:
+                    if device_id in histories:
+                        history = histories[device_id]
+                    else:
+                        target = house.get_device_by_id(device_id)
+                        history = histories[device_id] = target.measurement_history if (
+                            target is not None and isinstance(target.measurement_history, MeasurementSeries)) else None
+                    if history is not None:
+                        in_memory.append((history, to_epoch(ts), value, unit))
+                if len(batch) >= batch_size:
+                    cursor.executemany(sql, batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+                count += len(batch)
+
+            daily = {}
+            for (device_id, unit, hour), (n, total, low, high) in hourly.items():
+                key = (device_id, unit, hour[:10])
+                bucket = daily.get(key)
+                if bucket is None:
+                    daily[key] = [n, total, low, high]
+                else:
+                    bucket[0] += n
+                    bucket[1] += total
+                    bucket[2] = min(bucket[2], low)
+                    bucket[3] = max(bucket[3], high)
+            for table, buckets in (("measurements_hourly", hourly), ("measurements_daily", daily)):
+                cursor.executemany(ROLLUP_MERGE.format(table=table), [key + tuple(values) for key, values in buckets.items()])
+            cursor.execute("SELECT IFNULL(MAX(rowid), 0) FROM measurements")
+            last_rowid = cursor.fetchone()[0]
+            cursor.execute("UPDATE rollup_state SET last_rowid = ? WHERE id = 1", (last_rowid,))
+
+        # først når alt er lagret oppdaterer vi huset i minnet, og bare hvis det
+        # ikke mangler rader fra før; ellers henter apply_changes dem i rekkefølge
+        if house is not None:
+            with self.memory_lock:
+                if house.synced_rowid == first_rowid:
+                    for history, epoch, value, unit in in_memory:
+                        history.add(epoch, value, self.unit(unit))
+                    house.synced_rowid = last_rowid
+        if latest:
+            self._notify("measurement", [(device_id, ts, value, self.unit(unit))
+                                         for (device_id, unit), (ts, value) in latest.items()])
+        return count
+
+    # measurement history
+
+    def get_measurements(self, device_id: str, start: Optional[str] = None, end: Optional[str] = None,
+                         limit: int = 100, after: Optional[tuple] = None) -> tuple:
+        """
+        Returns one page of the measurements of the given device in timestamp order,
+        optionally restricted to timestamps between `start` and `end` (both inclusive).
+        Pages are found with keyset pagination: `after` is the (timestamp, rowid) key of
+        the last row of the previous page, so every page is a single index search no
+        matter how deep into the history it is.
+        The result is a (measurements, next) pair where `next` is the key to pass as
+        `after` for the following page, or None on the last page.
+        """
+        clauses = ["device = ?"]
+        params = [device_id]
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts <= ?")
+            params.append(end)
+        if after is not None:
+            clauses.append("(ts, rowid) > (?, ?)")
+            params.extend(after)
+        with self.read_cursor() as cursor:
+            cursor.execute(f"""
+                           SELECT rowid, ts, value, unit FROM measurements
+                           WHERE {" AND ".join(clauses)}
+                           ORDER BY ts, rowid LIMIT ?
+                           """, params + [limit + 1])
+            rows = cursor.fetchall()
+        next_key = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return [Measurement(ts, float(value), self.unit(unit)) for _, ts, value, unit in rows[:limit]], next_key
+
+    def get_measurement_buckets(self, device_id: str, every: int, start: Optional[str] = None, end: Optional[str] = None,
+                                limit: int = 100, after: Optional[int] = None) -> tuple:
+        """
+        Like `get_measurements`, but downsampled on the server: the readings are grouped
+        into buckets of `every` seconds and each bucket is returned as a
+        (timestamp, count, avg, min, max, unit) tuple, timestamp being the bucket start.
+        `after` is the epoch of the last bucket of the previous page. Each page reads at
+        most `limit` buckets worth of rows, so deep histories are never scanned as a whole.
+        """
+        if after is not None:
+            start = max(start or "", from_epoch(after + every))
+        with self.read_cursor() as cursor:
+            # første bucket med data bestemmer hvor siden begynner
+            cursor.execute("SELECT MIN(ts) FROM measurements WHERE device = ? AND ts >= ?", (device_id, start or ""))
+            first = cursor.fetchone()[0]
+            if first is None or (end is not None and first > end):
+                return [], None
+            first_bucket = to_epoch(first) // every * every
+            page_end = from_epoch(first_bucket + every * limit)
+            cursor.execute("""
+                           SELECT CAST(strftime('%s', ts) AS INTEGER) / ? AS bucket, unit,
+                                  COUNT(*), AVG(value), MIN(value), MAX(value)
+                           FROM measurements
+                           WHERE device = ? AND ts >= ? AND ts < ? AND ts <= ?
+                           GROUP BY bucket, unit ORDER BY bucket
+                           """, (every, device_id, first, page_end, end or "9999"))
+            rows = cursor.fetchall()
+            cursor.execute("SELECT 1 FROM measurements WHERE device = ? AND ts >= ? AND ts <= ? LIMIT 1",
+                           (device_id, page_end, end or "9999"))
+            more = cursor.fetchone() is not None
+        buckets = [(from_epoch(bucket * every), count, avg, low, high, self.unit(unit))
+                   for bucket, unit, count, avg, low, high in rows]
+        return buckets, (first_bucket + every * (limit - 1) if more else None)
+
+    def export_measurements(self, device_id: Optional[str] = None, start: Optional[str] = None,
+                            end: Optional[str] = None):
+        """
+        Generator yielding stored measurements as (device, timestamp, value, unit) tuples,
+        optionally for one device and between `start` and `end` (both inclusive).
+        Rows are fetched `FETCH_SIZE` at a time, so memory use does not depend on the
+        size of the export. For one device the rows come in timestamp order, otherwise
+        in the order they were stored.
+        The rows are read on a dedicated connection that is held until the generator
+        is exhausted or closed, so slow downloads do not use up the pooled readers.
+        """
+        clauses = []
+        params = []
+        if device_id is not None:
+            clauses.append("device = ?")
+            params.append(device_id)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts <= ?")
+            params.append(end)
+        where = "WHERE " + " AND ".join(clauses) if clauses else ""
+        order = "ts, rowid" if device_id is not None else "rowid"
+        units = self.units
+        with self.pool.dedicated_cursor() as cursor:
+            cursor.execute(f"SELECT device, ts, value, unit FROM measurements {where} ORDER BY {order}", params)
+            while True:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+                if not rows:
+                    break
+                for device, ts, value, unit in rows:
+                    yield device, ts, float(value), units[unit] if unit in units else self.unit(unit)
+
+    def downsample_measurements(self, device_id: str, points: int, start: Optional[str] = None,
+                                end: Optional[str] = None, method: str = LTTB) -> list:
+        """
+        Returns the measurements of the given device between `start` and `end` reduced to
+        about `points` measurements with LTTB or min/max bucketing (see `downsampling`).
+        The rows are read into compact columns of epoch seconds and values, only the
+        kept points are turned into _Measurement_ objects.
+        """
+        timestamps = array("q")
+        values = array("d")
+        units = []
+        with self.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT CAST(strftime('%s', ts) AS INTEGER), value, unit, ts FROM measurements
+                           WHERE device = ? AND ts >= ? AND ts <= ? ORDER BY ts, rowid
+                           """, (device_id, start or "", end or "9999"))
+            while True:
+                rows = cursor.fetchmany(self.FETCH_SIZE)
+                if not rows:
+                    break
+                for epoch, value, unit, ts in rows:
+                    timestamps.append(epoch if epoch is not None else to_epoch(ts))
+                    values.append(value)
+                    units.append(unit)
+        return [Measurement(from_epoch(timestamps[i]), values[i], self.unit(units[i]))
+                for i in downsample(timestamps, values, points, method)]
 
     # statistics
 
+    def room_id(self, room):
+        """
+        Returns the database id of the given room, looking it up by name
+        if the room object does not know it.
+        """
+        if room.room_id is not None:
+            return room.room_id
+        with self.read_cursor() as cursor:
+            cursor.execute("SELECT id FROM rooms WHERE name = ?", (room.room_name,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def daily_aggregates(self, room, unit, start: Optional[str] = None, end: Optional[str] = None) -> dict:
+        """
+        Returns count, sum, min and max per day (iso date -> [count, sum, min, max]) of the
+        readings with the given unit in the given room, for timestamps between `start` and
+        `end` (both inclusive, "YYYY-MM-DD HH:MM:SS", None means unbounded).
+        Whole days are answered from the daily rollups, only partial days at the
+        edges of the range are computed from the raw measurements.
+        """
+        self.refresh_rollups()
+        room_id = self.room_id(room)
+        first_day = None
+        last_day = None
+        if start is not None:
+            first_day = start[:10] if start[11:] in ("", "00:00:00") else next_day(start[:10])
+        if end is not None:
+            last_day = end[:10] if end[11:] in ("", "23:59:59") else previous_day(end[:10])
+
+        result = {}
+        with self.read_cursor() as cursor:
+            if first_day is None or last_day is None or first_day <= last_day:
+                cursor.execute("""
+                               SELECT r.bucket, SUM(r.count), SUM(r.sum), MIN(r.min), MAX(r.max)
+                               FROM devices d INNER JOIN measurements_daily r
+                               ON d.id = r.device
+                               WHERE r.unit = ? AND d.room = ? AND r.bucket >= ? AND r.bucket <= ?
+                               GROUP BY r.bucket
+                               """, (unit, room_id, first_day or "0000-00-00", last_day or "9999-99-99"))
+                for row in cursor.fetchall():
+                    result[row[0]] = list(row[1:])
+
+            # kantene av intervallet som ikke dekker en hel dag
+            edges = []
+            start_edge = start is not None and first_day != start[:10]
+            if start_edge:
+                edges.append((start, end if end is not None and end[:10] == start[:10] else start[:10] + " 23:59:59"))
+            # en startkant på samme dag dekker allerede slutten av intervallet
+            if end is not None and last_day != end[:10] and not (start_edge and end[:10] == start[:10]):
+                edges.append((end[:10] + " 00:00:00", end))
+            for edge_start, edge_end in edges:
+                cursor.execute("""
+                               SELECT substr(m.ts, 1, 10), COUNT(*), SUM(m.value), MIN(m.value), MAX(m.value)
+                               FROM devices d INNER JOIN measurements m
+                               ON d.id = m.device
+                               WHERE m.unit = ? AND d.room = ? AND m.ts >= ? AND m.ts <= ?
+                               GROUP BY 1
+                               """, (unit, room_id, edge_start, edge_end))
+                for row in cursor.fetchall():
+                    result[row[0]] = list(row[1:])
+        return result
+
+    def hourly_aggregates(self, room, unit, date: str) -> dict:
+        """
+        Returns count, sum, min and max per hour (0-23 -> [count, sum, min, max]) of the
+        readings with the given unit in the given room on the given day, read from the hourly rollups.
+        """
+        self.refresh_rollups()
+        room_id = self.room_id(room)
+        with self.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT substr(r.bucket, 12, 2), SUM(r.count), SUM(r.sum), MIN(r.min), MAX(r.max)
+                           FROM devices d INNER JOIN measurements_hourly r
+                           ON d.id = r.device
+                           WHERE r.unit = ? AND d.room = ? AND r.bucket >= ? AND r.bucket < ?
+                           GROUP BY r.bucket
+                           """, (unit, room_id, date + " 00", next_day(date) + " 00"))
+            return {int(row[0]): list(row[1:]) for row in cursor.fetchall()}
+
     
     def calc_avg_temperatures_in_room(self, room, from_date: Optional[str] = None, until_date: Optional[str] = None) -> dict:
         """Calculates the average temperatures in the given room for the given time range by
@@ -143,38 +1109,12 @@ class SmartHouseRepository:
         The result should be a dictionary where the keys are strings representing dates (iso format) and 
         the values are floating point numbers containing the average temperature that day.
         """
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id FROM rooms WHERE name = ?", (room.room_name,))
-        
-        rows =  cursor.fetchall()
-        if rows:
-            room_id = rows[0][0]
+        start = None if from_date is None else from_date + " 00:00:00"
+        end = None if until_date is None else until_date + " 23:59:59"
 
-        if (from_date is None):
-            from_date = "0001-01-01 00:00:00"
-        else:
-            from_date = from_date + " 00:00:00"
-        if (until_date is None):
-            until_date = "9999-12-31 23:59:59"
-        else:
-            until_date = until_date + " 23:59:59"
-
-
-        cursor.execute("""
-                       SELECT m.ts, AVG(m.value) AS avg_temp 
-                       FROM devices d INNER JOIN measurements m
-                       ON d.id = m.device
-                       WHERE m.unit = '°C' AND d.room = ? AND m.ts >= ? AND m.ts <= ?
-                       GROUP BY d.room, DATE(m.ts)  ORDER BY m.ts
-                       """, (room_id, from_date, until_date))
-        
         avg_temperatures = {}
-
-        for row in cursor.fetchall():
-            timestamp = row[0]
-            date_str = timestamp.split(" ")[0]
-
-            avg_temperatures[date_str] = row[1]
+        for day, (count, total, _, _) in sorted(self.daily_aggregates(room, '°C', start, end).items()):
+            avg_temperatures[day] = total / count
 
         return avg_temperatures
 
@@ -188,39 +1128,29 @@ class SmartHouseRepository:
         The result is a (possibly empty) list of number representing hours [0-23].
         """
 
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT id FROM rooms WHERE name = ?", (room.room_name,))
-        
-        rows =  cursor.fetchall()
-        if rows:
-            room_id = rows[0][0]
+        room_id = self.room_id(room)
 
+        day_start = date + " 00:00:00"
+        day_end = next_day(date) + " 00:00:00"
 
-        cursor.execute("""
-                       SELECT AVG(m.value)
-                       FROM devices d INNER JOIN measurements m
-                       ON d.id = m.device
-                       WHERE m.unit = '%' AND d.room = ?
-                       GROUP BY DATE(m.ts)
-                       HAVING DATE(m.ts) = ?
-                       """,(room_id, date))
-
-        rows =  cursor.fetchall()
-        if rows:
-            avg_humidity = rows[0][0]
-        
+        daily = self.daily_aggregates(room, '%', day_start, date + " 23:59:59").get(date)
+        if not daily:
+            return []
+        avg_humidity = daily[1] / daily[0]
 
-        cursor.execute("""
-                       SELECT strftime('%H', m.ts)
-                       FROM devices d INNER JOIN measurements m
-                       ON d.id = m.device
-                       WHERE m.unit = '%' AND d.room = ? AND m.value >= ? AND DATE(m.ts) = ?
-                       GROUP BY strftime('%H', m.ts)
-                       HAVING COUNT(*) > 3
-                       """,(room_id, avg_humidity, date))
+        with self.read_cursor() as cursor:
+            cursor.execute("""
+                           SELECT substr(m.ts, 12, 2) AS hour
+                           FROM devices d INNER JOIN measurements m
+                           ON d.id = m.device
+                           WHERE m.unit = '%' AND d.room = ? AND m.value >= ? AND m.ts >= ? AND m.ts < ?
+                           GROUP BY hour
+                           HAVING COUNT(*) > 3
+                           """,(room_id, avg_humidity, day_start, day_end))
+            rows = cursor.fetchall()
         
         hours = []
-        for row in cursor.fetchall():
+        for row in rows:
             if row[0]:
                 hours.append(int(row[0]))
 
@@ -0,0 +1,134 @@
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+
+class ConnectionPool:
+    """
+    Hands out SQLite connections to one database file: a single writer
+    connection, guarded by a lock since SQLite only allows one writer at a time,
+    and up to `readers` read-only connections that threads borrow and return.
+    In WAL mode the readers see the last committed state and never wait for the writer.
+    Connections are created with the given `connect` function and cursors with `cursor_factory`.
+    """
+
+    def __init__(self, connect, readers: int = 4, timeout: float = 30.0, cursor_factory = sqlite3.Cursor) -> None:
+        self.connect = connect
+        self.cursor_factory = cursor_factory
+        self.max_readers = readers
+        self.timeout = timeout
+        self.writer = connect()
+        self.write_lock = threading.RLock()
+        self.idle = queue.LifoQueue()
+        self.readers = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _connect_reader(self):
+        conn = self.connect()
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _acquire_reader(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if len(self.readers) < self.max_readers:
+                conn = self._connect_reader()
+                self.readers.append(conn)
+                return conn
+        # alle lesere er i bruk, vent på at en blir ledig
+        try:
+            return self.idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("no read connection became available") from None
+
+    def _release_reader(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        if self.closed:
+            conn.close()
+        else:
+            self.idle.put(conn)
+
+    @contextmanager
+    def read_connection(self):
+        """
+        Borrows a read-only connection for the duration of the `with` block.
+        """
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    @contextmanager
+    def read_cursor(self):
+        """
+        Provides a cursor on a read-only connection that is closed and
+        returned to the pool when the `with` block ends.
+        """
+        with self.read_connection() as conn:
+            cursor = conn.cursor(self.cursor_factory)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def dedicated_cursor(self):
+        """
+        Provides a cursor on a new read-only connection outside the pool that is
+        closed when the `with` block ends. Meant for long running reads, such as
+        streaming exports, that should not keep a pooled reader from other requests.
+        """
+        conn = self._connect_reader()
+        try:
+            cursor = conn.cursor(self.cursor_factory)
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def write_cursor(self):
+        """
+        Provides a cursor on the writer connection while holding the write lock.
+        The transaction is committed when the `with` block ends normally and
+        rolled back if it raises.
+        """
+        with self.write_lock:
+            cursor = self.writer.cursor(self.cursor_factory)
+            try:
+                yield cursor
+                self.writer.commit()
+            except BaseException:
+                self.writer.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def connections(self):
+        """
+        Returns all connections opened by the pool, the writer first.
+        """
+        with self.lock:
+            return [self.writer] + list(self.readers)
+
+    def close(self):
+        """
+        Closes the writer and all idle readers; borrowed readers are closed when they are returned.
+        """
+        self.closed = True
+        with self.write_lock:
+            self.writer.close()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
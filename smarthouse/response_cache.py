@@ -0,0 +1,82 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import hashlib
+import json
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import Request, Response
+from smarthouse.domain import SmartHouse
+
+
+class ResponseCache:
+    """
+    Keeps the serialized JSON of read-mostly endpoints together with the version of
+    the _SmartHouse_ it was built from. As long as the house is not changed a request
+    is answered with the stored bytes; every response carries an ETag (a hash of the
+    body) and Last-Modified, and conditional requests that match get a 304.
+    When the house version changes the body is built again, but ETag and Last-Modified
+    only change if the JSON actually differs.
+    """
+
+    def __init__(self, house: SmartHouse, max_entries: int = 1024) -> None:
+        self.house = house
+        self.max_entries = max_entries
+        # key -> (version, body, etag, last_modified)
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self, house: SmartHouse):
+        """
+        Drops all entries, e.g. after the house has been replaced by a full reload.
+        """
+        self.house = house
+        self.entries.clear()
+
+    def _entry(self, key, build):
+        version = self.house.version
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        body = json.dumps(build(), ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+        if entry is not None and entry[1] == body:
+            entry = (version, body, entry[2], entry[3])
+        else:
+            entry = (version, body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"', int(time.time()))
+        if key not in self.entries and len(self.entries) >= self.max_entries:
+            # den eldste nøkkelen fjernes, dict beholder innsettingsrekkefølgen
+            del self.entries[next(iter(self.entries))]
+        self.entries[key] = entry
+        return entry
+
+    def respond(self, request: Request, key, build) -> Response:
+        """
+        Returns the cached response for `key`, calling `build()` for the content
+        only if the house has changed since it was cached.
+        """
+        _, body, etag, last_modified = self._entry(key, build)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(last_modified, usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if self._not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    def _not_modified(self, request, etag, last_modified):
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return "*" in tags or etag in tags or "W/" + etag in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is not None:
+            try:
+                return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
@@ -0,0 +1,118 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import json
+import os
+import struct
+from smarthouse.domain import SmartHouse, Sensor, Aktuator
+
+# Layout of a snapshot file, all integers little endian:
+#   header: magic, format version, schema version, synced_seq, synced_rowid, length of the structure
+#   structure: UTF-8 JSON with floors, rooms, devices, actuator states and history sizes
+#   columns: for every device in structure order its timestamps ('q'), values ('d') and unit codes ('H')
+MAGIC = b"SHSNAP"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<6sHqqqI")
+COLUMNS = (("timestamps", "q"), ("values", "d"), ("unit_codes", "H"))
+
+
+class SnapshotError(Exception):
+    """
+    Raised when a snapshot file cannot be used, e.g. because it was written
+    by another format version or is truncated.
+    """
+
+
+def write_snapshot(house: SmartHouse, path, schema_version: int, measurements: bool = True):
+    """
+    Writes the whole house to `path`: its structure, actuator states and, if
+    `measurements` is true, the measurement columns of every device as raw array bytes.
+    The file is replaced atomically, so readers never see a half written snapshot.
+    """
+    floors = []
+    histories = []
+    for floor in house.get_floors():
+        rooms = []
+        for room in floor.rooms:
+            devices = []
+            for device in room.devices:
+                history = device.measurement_history
+                if measurements:
+                    histories.append(history)
+                devices.append([device.id, device.supplier, device.model_name, device.device_type, device.category,
+                                getattr(device, "state", None),
+                                len(history) if measurements else 0, history.units if measurements else []])
+            rooms.append([room.room_id, room.room_name, room.area, devices])
+        floors.append([floor.level, rooms])
+    structure = json.dumps({"name": house.name, "byteorder": sys.byteorder, "measurements": measurements,
+                            "floors": floors}, separators=(",", ":")).encode("utf-8")
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, schema_version, house.synced_seq, house.synced_rowid, len(structure)))
+        f.write(structure)
+        for history in histories:
+            for column, _ in COLUMNS:
+                getattr(history, column).tofile(f)
+    os.replace(tmp, path)
+
+
+def read_snapshot(path, measurements: bool = True) -> tuple:
+    """
+    Reads a snapshot written by `write_snapshot` and returns (schema version, house).
+    With `measurements=False` the measurement columns are skipped and every device
+    gets an empty history. Raises `SnapshotError` if the file cannot be used.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise SnapshotError("snapshot is truncated")
+    magic, version, schema_version, synced_seq, synced_rowid, length = HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise SnapshotError("unknown snapshot format")
+    try:
+        structure = json.loads(data[HEADER.size:HEADER.size + length])
+        if measurements and not structure["measurements"]:
+            raise SnapshotError("snapshot has no measurements")
+        if structure["byteorder"] != sys.byteorder:
+            raise SnapshotError("snapshot was written with another byte order")
+        house, offset = _read_house(structure, memoryview(data), HEADER.size + length, measurements)
+    except (ValueError, KeyError, TypeError) as e:
+        # også avkortede kolonner og felt med feil type i strukturen
+        raise SnapshotError("snapshot structure is damaged") from e
+    if offset != len(data):
+        raise SnapshotError("snapshot is truncated")
+    house.synced_seq = synced_seq
+    house.synced_rowid = synced_rowid
+    return schema_version, house
+
+
+def _read_house(structure, view, offset, measurements):
+    # leser husets struktur og målekolonnene som starter ved `offset`
+    house = SmartHouse(structure["name"])
+    for level, rooms in structure["floors"]:
+        floor = house.register_floor(level)
+        for room_id, name, area, devices in rooms:
+            room = house.register_room(floor, area, name, room_id)
+            for device_id, supplier, model, kind, category, state, count, units in devices:
+                if category == "aktuator":
+                    device = Aktuator(device_id, supplier, model, kind)
+                    device.state = state
+                else:
+                    device = Sensor(device_id, supplier, model, kind, category)
+                if structure["measurements"]:
+                    history = device.measurement_history
+                    for column, typecode in COLUMNS:
+                        values = getattr(history, column)
+                        size = count * values.itemsize
+                        if offset + size > len(view):
+                            raise SnapshotError("snapshot is truncated")
+                        if measurements:
+                            values.frombytes(view[offset:offset + size])
+                        offset += size
+                    if measurements:
+                        history.units.extend(units)
+                        history.unit_index.update((unit, code) for code, unit in enumerate(units))
+                house.register_device(room, device)
+    return house, offset
@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from smarthouse.domain import SmartHouse
+
+
+class HouseSync:
+    """
+    Keeps a loaded _SmartHouse_ up to date with the database in the background.
+    Every `interval` seconds the changes after the high-water marks of the house are
+    read on a separate thread (`SmartHouseRepository.fetch_changes`) and then patched
+    into the house on the event loop (`apply_changes`), so requests are never blocked
+    by the database and always see either the old or the new state of a change.
+    """
+
+    def __init__(self, repo, house: SmartHouse, lazy = False, interval: float = 5.0) -> None:
+        self.repo = repo
+        self.house = house
+        self.lazy = lazy
+        self.interval = interval
+        self.task = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync")
+        # metrics
+        self.syncs = 0
+        self.failed_syncs = 0
+        self.last_error = None
+        self.last_sync_seconds = 0.0
+
+    async def start(self):
+        """
+        Starts the periodic synchronisation on the running event loop.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+        self.executor.shutdown(wait=True)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                # prøves igjen ved neste intervall
+                self.failed_syncs += 1
+                self.last_error = repr(e)
+
+    async def sync(self) -> dict:
+        """
+        Brings the house up to date once and returns the applied changes.
+        """
+        start = time.monotonic()
+        loop = asyncio.get_running_loop()
+        changes = await loop.run_in_executor(self.executor, self.repo.fetch_changes, self.house, self.lazy)
+        self.repo.apply_changes(self.house, changes, self.lazy)
+        self.syncs += 1
+        self.last_sync_seconds = time.monotonic() - start
+        return changes
@@ -0,0 +1,57 @@
+import unittest
+import shutil
+import tempfile
+
+from pathlib import Path
+import sys
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.persistence import SmartHouseRepository
+
+DB_FILE = Path(__file__).parent / "../data/db.sql"
+
+
+def copy_database(directory, name = "db.sql") -> Path:
+    """
+    Copies data/db.sql into `directory` and returns the path of the copy. Tests never
+    open the tracked file itself, since opening a repository migrates the schema
+    and switches the file to WAL mode.
+    """
+    file = Path(directory) / name
+    shutil.copy(DB_FILE, file)
+    return file
+
+
+class DatabaseTest(unittest.TestCase):
+    """
+    Gives every test a fresh copy of data/db.sql (`self.file`) in a temporary
+    directory and a repository on it (`self.repo`) with `readers` read connections.
+    """
+
+    readers = 4
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file = copy_database(self.tmp.name)
+        self.repo = SmartHouseRepository(str(self.file), readers=self.readers)
+
+    def tearDown(self):
+        self.repo.pool.close()
+        self.tmp.cleanup()
+
+
+class SharedDatabaseTest(unittest.TestCase):
+    """
+    Like `DatabaseTest`, but the copy and the repository are shared by all tests of the class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.file = copy_database(cls.tmp.name)
+        cls.repo = SmartHouseRepository(str(cls.file))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.repo.pool.close()
+        cls.tmp.cleanup()
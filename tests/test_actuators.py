@@ -0,0 +1,60 @@
+import unittest
+import asyncio
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.async_persistence import AsyncSmartHouseRepository
+from smarthouse.coalesce import ActuatorStateCoalescer
+from fixtures import DatabaseTest
+
+PLUG = "1a66c3d6-22b2-446e-bf5c-eb5b9d1a8c79"
+
+class ActuatorUpdateTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.house = self.repo.load_smarthouse_deep(lazy=True)
+        self.actuators = [device for device in self.house.get_devices() if device.is_actuator()]
+        self.notifications = []
+        self.repo.add_listener(lambda kind, changes: self.notifications.append(changes))
+
+    def stored_states(self):
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("SELECT id, state FROM ActuatorState")
+            return dict(cursor.fetchall())
+
+    def test_bulk_update(self):
+        for actuator in self.actuators:
+            actuator.turn_on()
+        self.assertEqual(len(self.actuators), self.repo.update_actuator_states(self.actuators))
+        self.assertEqual({actuator.id: 1 for actuator in self.actuators}, self.stored_states())
+        # én transaksjon, én melding
+        self.assertEqual(1, len(self.notifications))
+
+    def test_coalesced_toggles(self):
+        arepo = AsyncSmartHouseRepository(self.repo)
+        coalescer = ActuatorStateCoalescer(arepo, window=0.05)
+        plug = self.house.get_device_by_id(PLUG)
+        other = next(actuator for actuator in self.actuators if actuator is not plug)
+
+        async def toggle(actuator, on):
+            if on:
+                actuator.turn_on()
+            else:
+                actuator.turn_off()
+            await coalescer.submit(actuator)
+
+        async def run():
+            await asyncio.gather(*[toggle(plug, i % 2 == 0) for i in range(31)], toggle(other, True))
+
+        asyncio.run(run())
+        arepo.close()
+        self.assertEqual({"submitted": 32, "flushes": 1, "written": 2, "pending": 0}, coalescer.metrics())
+        states = self.stored_states()
+        self.assertEqual((1, 1), (states[PLUG], states[other.id]))
+
+
+if __name__ == '__main__':
+    unittest.main()
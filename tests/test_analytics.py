@@ -0,0 +1,41 @@
+import unittest
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.analytics import HouseStatistics, rolling_mean, summary, TEMPERATURE
+from fixtures import SharedDatabaseTest
+
+class HouseStatisticsTest(SharedDatabaseTest):
+
+    def test_same_results_as_sql(self):
+        h = self.repo.load_smarthouse_deep()
+        stats = HouseStatistics(self.repo)
+        for room in h.get_rooms():
+            for from_date, until_date in [(None, None), ('2024-01-27', None), (None, '2024-01-26'), ('2024-01-15', '2024-01-28')]:
+                expected = self.repo.calc_avg_temperatures_in_room(room, from_date, until_date)
+                actual = stats.calc_avg_temperatures_in_room(room, from_date, until_date)
+                self.assertEqual(expected.keys(), actual.keys())
+                for k in expected.keys():
+                    self.assertAlmostEqual(expected[k], actual[k], 6)
+
+        bath = [r for r in h.get_rooms() if r.room_name == "Bathroom 1"][0]
+        for date in ['2024-01-26', '2024-01-27', '2024-01-28']:
+            self.assertEqual(self.repo.calc_hours_with_humidity_above(bath, date),
+                             stats.calc_hours_with_humidity_above(bath, date))
+
+    def test_summary_and_rolling_mean(self):
+        stats = HouseStatistics(self.repo)
+        bedroom = stats.unit_series(TEMPERATURE)[12]
+        s = summary(bedroom)
+        self.assertEqual(s["count"], len(bedroom))
+        self.assertLessEqual(s["min"], s["p50"])
+        self.assertLessEqual(s["p50"], s["max"])
+        rolling = rolling_mean(bedroom, 4)
+        self.assertEqual(len(rolling), len(bedroom))
+        self.assertAlmostEqual(rolling[3][1], sum(bedroom.values[0:4]) / 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+import base64
+import json
+import os
+import tempfile
+from unittest import mock
+
+from pathlib import Path
+import sys
+sys.path.append(str(Path().parent.absolute()))
+
+from fixtures import copy_database
+
+try:
+    from fastapi.testclient import TestClient
+except ImportError:
+    TestClient = None
+
+HUMIDITY = "3d87e5c0-8716-4b0b-9c67-087eaaed7b45"
+
+def cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+@unittest.skipIf(TestClient is None, "FastAPI is not installed")
+class ApiTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        file = copy_database(cls.tmp.name)
+        cls.environ = mock.patch.dict(os.environ, {"SMARTHOUSE_DB": str(file), "SMARTHOUSE_HOUSES": cls.tmp.name})
+        cls.environ.start()
+        cwd = os.getcwd()
+        from smarthouse import api
+        os.chdir(cwd)
+        cls.api = api
+        cls.client = TestClient(api.app)
+        cls.client.__enter__()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+        cls.environ.stop()
+        cls.tmp.cleanup()
+
+    def test_values_reject_invalid_cursor_and_timestamps(self):
+        url = f"/smarthouse/sensor/{HUMIDITY}/values"
+        first = self.client.get(url, params={"limit": 2})
+        self.assertEqual(200, first.status_code)
+        second = self.client.get(url, params={"limit": 2, "cursor": first.json()["next"]})
+        self.assertEqual(200, second.status_code)
+        for key in (["a", {"x": 1}], [1, 2], ["a"], "a", ["a", True]):
+            self.assertEqual(400, self.client.get(url, params={"cursor": cursor(key)}).status_code)
+        self.assertEqual(400, self.client.get(url, params={"every": 3600, "cursor": cursor("a")}).status_code)
+        # numbers too large for SQLite or for a timestamp
+        self.assertEqual(400, self.client.get(url, params={"every": 3600, "cursor": cursor(10 ** 20)}).status_code)
+        self.assertEqual(400, self.client.get(url, params={"cursor": cursor(["2024-01-27 00:00:00", 10 ** 20])}).status_code)
+        self.assertEqual(422, self.client.get(url, params={"every": 10 ** 20}).status_code)
+        self.assertEqual(400, self.client.get(url, params={"cursor": "not base64 json"}).status_code)
+        self.assertEqual(400, self.client.get(url, params={"from": "garbage"}).status_code)
+        self.assertEqual(400, self.client.get(url, params={"until": "2024-13-01"}).status_code)
+        day = self.client.get(url, params={"from": "2024-01-27", "until": "2024-01-27T23:59:59", "limit": 1})
+        self.assertEqual(200, day.status_code)
+        self.assertTrue(day.json()["values"][0]["timestamp"].startswith("2024-01-27"))
+
+    def test_conditional_requests(self):
+        first = self.client.get("/smarthouse")
+        self.assertEqual(200, first.status_code)
+        etag = first.headers["etag"]
+        last_modified = first.headers["last-modified"]
+        self.assertEqual(304, self.client.get("/smarthouse", headers={"If-None-Match": etag}).status_code)
+        self.assertEqual(304, self.client.get("/smarthouse", headers={"If-Modified-Since": last_modified}).status_code)
+        self.assertEqual(200, self.client.get("/smarthouse", headers={"If-None-Match": '"other"'}).status_code)
+
+        # an actuator change does not change the structure, so the cached response stays valid
+        plug = "1a66c3d6-22b2-446e-bf5c-eb5b9d1a8c79"
+        self.assertEqual(200, self.client.put(f"/smarthouse/actuator/{plug}/current", json={"state": True}).status_code)
+        self.assertEqual(304, self.client.get("/smarthouse", headers={"If-None-Match": etag}).status_code)
+        self.assertEqual(200, self.client.put(f"/smarthouse/actuator/{plug}/current", json={"state": False}).status_code)
+
+        # a changed room area does
+        room = self.api.smarthouse.get_room_by_id(1)
+        area = room.area
+        room.area = area + 10
+        try:
+            changed = self.client.get("/smarthouse", headers={"If-None-Match": etag})
+            self.assertEqual(200, changed.status_code)
+            self.assertNotEqual(etag, changed.headers["etag"])
+            self.assertAlmostEqual(first.json()["area"] + 10, changed.json()["area"])
+            floors = self.client.get("/smarthouse/floor")
+            self.assertEqual(304, self.client.get("/smarthouse/floor", headers={"If-None-Match": floors.headers["etag"]}).status_code)
+        finally:
+            room.area = area
+        # back to the old content, so the old ETag matches again
+        self.assertEqual(304, self.client.get("/smarthouse", headers={"If-None-Match": etag}).status_code)
+
+    def test_actuator_levels_are_rejected(self):
+        # only on/off is stored, so a level would be lost at the next sync
+        oven = "8d4e4c98-21a9-4d1e-bf18-523285ad90f6"
+        self.assertEqual(422, self.client.put(f"/smarthouse/actuator/{oven}/current", json={"state": 0.5}).status_code)
+        self.assertEqual(422, self.client.put("/smarthouse/actuator", json={"states": {oven: 0.5}}).status_code)
+        self.assertEqual(200, self.client.put(f"/smarthouse/actuator/{oven}/current", json={"state": True}).status_code)
+        self.assertEqual({"state": True}, self.client.get(f"/smarthouse/actuator/{oven}/current").json())
+        self.assertEqual(200, self.client.put(f"/smarthouse/actuator/{oven}/current", json={"state": False}).status_code)
+
+    def test_unknown_floors_are_not_cached(self):
+        cache = self.api.response_cache
+        for level in range(100, 120):
+            self.assertEqual([], self.client.get(f"/smarthouse/floor/{level}").json())
+            self.assertEqual([], self.client.get(f"/smarthouse/floor/{level}/room").json())
+        self.assertFalse([key for key in cache.entries if isinstance(key, tuple) and key[1] >= 100])
+        self.assertEqual(200, self.client.get("/smarthouse/floor/1/room").status_code)
+        self.assertIn(("rooms", 1), cache.entries)
+
+        # the number of entries is bounded as well
+        max_entries = cache.max_entries
+        cache.max_entries = 2
+        cache.entries.clear()
+        try:
+            for key in ("a", "b", "c"):
+                cache._entry(key, lambda: [])
+            self.assertEqual(["b", "c"], list(cache.entries))
+        finally:
+            cache.max_entries = max_entries
+            cache.entries.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
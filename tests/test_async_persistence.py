@@ -0,0 +1,54 @@
+import unittest
+import asyncio
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.async_persistence import AsyncSmartHouseRepository
+from fixtures import DatabaseTest
+
+class AsyncRepositoryTest(DatabaseTest):
+    readers = 2
+
+    def setUp(self):
+        super().setUp()
+        self.arepo = AsyncSmartHouseRepository(self.repo)
+
+    def tearDown(self):
+        self.arepo.close()
+        super().tearDown()
+
+    def test_async_reads_match_sync_reads(self):
+        async def run():
+            h = await self.arepo.load_smarthouse_deep(lazy=True)
+            bath = h.get_room_by_name("Bathroom 1")
+            living = h.get_room_by_name("Living Room / Kitchen")
+            sensor = h.get_device_by_id("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
+            # mange samtidige forespørsler deler to lesetråder
+            results = await asyncio.gather(*(
+                [self.arepo.calc_hours_with_humidity_above(bath, "2024-01-27") for _ in range(20)] +
+                [self.arepo.calc_avg_temperatures_in_room(living, "2024-01-21", "2024-01-25") for _ in range(20)] +
+                [self.arepo.get_latest_reading(sensor) for _ in range(20)]))
+            return bath, living, sensor, results
+
+        bath, living, sensor, results = asyncio.run(run())
+        self.assertEqual([self.repo.calc_hours_with_humidity_above(bath, "2024-01-27")] * 20, results[:20])
+        self.assertEqual([self.repo.calc_avg_temperatures_in_room(living, "2024-01-21", "2024-01-25")] * 20, results[20:40])
+        self.assertEqual(self.repo.get_latest_reading(sensor).timestamp, results[40].timestamp)
+
+    def test_async_writes(self):
+        async def run():
+            h = await self.arepo.load_smarthouse_deep()
+            plug = h.get_device_by_id("1a66c3d6-22b2-446e-bf5c-eb5b9d1a8c79")
+            plug.turn_on()
+            await self.arepo.update_actuator_state(plug)
+            count = await self.arepo.ingest_measurements([("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e", "2024-02-01 10:00:00", 20.0, "°C")])
+            state = await self.arepo.read(lambda cursor, id: cursor.execute("SELECT state FROM ActuatorState WHERE id = ?", (id,)).fetchone()[0], plug.id)
+            return count, state
+
+        self.assertEqual((1, 1), asyncio.run(run()))
+
+
+if __name__ == '__main__':
+    unittest.main()
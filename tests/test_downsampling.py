@@ -0,0 +1,55 @@
+import unittest
+import math
+import tempfile
+from array import array
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.downsampling import lttb, minmax, downsample
+from smarthouse.persistence import SmartHouseRepository
+from fixtures import copy_database
+
+class DownsamplingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timestamps = array("q", range(0, 100000, 10))
+        self.values = array("d", (math.sin(i / 500) for i in range(10000)))
+        # en enkelt topp som ikke må forsvinne
+        self.values[4321] = 5.0
+
+    def test_lttb(self):
+        kept = lttb(self.timestamps, self.values, 200)
+        self.assertEqual(200, len(kept))
+        self.assertEqual(sorted(kept), kept)
+        self.assertEqual((0, 9999), (kept[0], kept[-1]))
+        self.assertIn(4321, kept)
+        self.assertEqual(list(range(10)), lttb(self.timestamps[:10], self.values[:10], 200))
+
+    def test_minmax(self):
+        kept = minmax(self.timestamps, self.values, 200)
+        self.assertLessEqual(len(kept), 200)
+        self.assertEqual(sorted(kept), kept)
+        self.assertIn(4321, kept)
+        self.assertEqual(min(self.values), min(self.values[i] for i in kept))
+        with self.assertRaises(ValueError):
+            downsample(self.timestamps, self.values, 200, "mean")
+
+    def test_repository(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        repo = SmartHouseRepository(str(copy_database(tmp.name)))
+        self.addCleanup(repo.pool.close)
+        device = "3d87e5c0-8716-4b0b-9c67-087eaaed7b45"
+        full, _ = repo.get_measurements(device, "2024-01-27 00:00:00", "2024-01-27 23:59:59", 10000)
+        reduced = repo.downsample_measurements(device, 50, "2024-01-27 00:00:00", "2024-01-27 23:59:59")
+        self.assertEqual(50, len(reduced))
+        self.assertEqual((full[0].timestamp, full[-1].timestamp), (reduced[0].timestamp, reduced[-1].timestamp))
+        self.assertEqual("%", reduced[0].unit)
+        peaks = repo.downsample_measurements(device, 50, "2024-01-27 00:00:00", "2024-01-27 23:59:59", "minmax")
+        self.assertEqual(max(m.value for m in full), max(m.value for m in peaks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import csv
+import gzip
+import io
+import json
+import tracemalloc
+from contextlib import ExitStack
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.export import ndjson_chunks, csv_chunks, gzip_chunks, encode_chunks
+from fixtures import DatabaseTest
+
+HUMIDITY_SENSOR = "3d87e5c0-8716-4b0b-9c67-087eaaed7b45"
+
+class ExportTest(DatabaseTest):
+
+    def test_formats(self):
+        rows = list(self.repo.export_measurements(HUMIDITY_SENSOR, "2024-01-27 00:00:00", "2024-01-27 23:59:59"))
+        self.assertTrue(all(row[0] == HUMIDITY_SENSOR and row[1].startswith("2024-01-27") for row in rows))
+        self.assertEqual(sorted(row[1] for row in rows), [row[1] for row in rows])
+
+        lines = "".join(ndjson_chunks(rows, chunk_rows=100)).splitlines()
+        self.assertEqual(len(rows), len(lines))
+        self.assertEqual({"device": HUMIDITY_SENSOR, "timestamp": rows[0][1], "value": rows[0][2], "unit": "%"}, json.loads(lines[0]))
+
+        data = gzip.decompress(b"".join(gzip_chunks(csv_chunks(rows, chunk_rows=100)))).decode("utf-8")
+        table = list(csv.reader(io.StringIO(data)))
+        self.assertEqual(["device", "timestamp", "value", "unit"], table[0])
+        self.assertEqual([list(map(str, row)) for row in rows], table[1:])
+
+    def test_export_runs_in_constant_memory(self):
+        self.repo.ingest_measurements((HUMIDITY_SENSOR, 1706313600 + i, 50.0 + i % 10, "%") for i in range(40000))
+        self.repo.FETCH_SIZE = 1000
+        size = 0
+        count = 0
+        tracemalloc.start()
+        try:
+            for chunk in encode_chunks(ndjson_chunks(self.repo.export_measurements(), chunk_rows=1000)):
+                size += len(chunk)
+                count += chunk.count(b"\n")
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertGreater(count, 40000)
+        # the whole export is many times larger than what was held in memory at once
+        self.assertLess(peak, size / 4)
+
+    def test_exports_do_not_hold_pooled_readers(self):
+        self.repo.pool.timeout = 1.0
+        exports = [self.repo.export_measurements() for _ in range(self.readers + 1)]
+        try:
+            for rows in exports:
+                next(rows)
+            # every export is in progress, yet all pooled readers can still be borrowed at once
+            with ExitStack() as stack:
+                for _ in range(self.readers):
+                    cursor = stack.enter_context(self.repo.read_cursor())
+                    self.assertEqual(12, cursor.execute("SELECT COUNT(*) FROM rooms").fetchone()[0])
+        finally:
+            for rows in exports:
+                rows.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
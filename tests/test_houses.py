@@ -0,0 +1,71 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+
+from pathlib import Path
+import sys
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.houses import HouseRegistry, estimate_size
+from fixtures import copy_database
+
+class HouseRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        for house_id in ("a", "b", "c"):
+            copy_database(self.directory, f"{house_id}.sql")
+        self.registry = HouseRegistry(self.directory, workers=2)
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmp.cleanup()
+
+    def test_houses_are_loaded_on_demand_and_evicted(self):
+        self.assertEqual(["a", "b", "c"], self.registry.house_ids())
+        self.assertIsNone(self.registry.get("d"))
+        self.assertIsNone(self.registry.get("../a"))
+        self.assertEqual([], self.registry.loaded())
+
+        a = self.registry.get("a")
+        self.assertEqual(12, len(a.get_rooms()))
+        self.assertIs(a, self.registry.get("a"))
+        self.assertEqual((1, 1), (self.registry.hits, self.registry.misses))
+
+        # room for two houses
+        self.registry.memory_budget = estimate_size(a) * 2 + 1
+        b = self.registry.get("b")
+        self.registry.get("a")
+        self.registry.get("c")
+        # b was used least recently
+        self.assertEqual(["a", "c"], self.registry.loaded())
+        self.assertEqual(1, self.registry.evictions)
+        self.assertIsNot(b, self.registry.get("b"))
+        self.assertEqual(["c", "b"], self.registry.loaded())
+        self.assertLessEqual(self.registry.size, self.registry.memory_budget)
+
+    def test_parallel_load_and_refresh(self):
+        self.assertEqual(3, self.registry.load())
+        self.assertEqual(["a", "b", "c"], self.registry.loaded())
+        for house_id in ("a", "b", "c"):
+            self.assertTrue(os.path.exists(self.directory / f"{house_id}.sql.snapshot"))
+
+        oven = "8d4e4c98-21a9-4d1e-bf18-523285ad90f6"
+        self.assertFalse(self.registry.get("b").get_device_by_id(oven).is_active())
+        conn = sqlite3.connect(self.directory / "b.sql")
+        conn.execute("UPDATE ActuatorState SET state = 21.5 WHERE id = ?", (oven,))
+        conn.commit()
+        conn.close()
+
+        self.registry.refresh()
+        self.assertTrue(self.registry.get("b").get_device_by_id(oven).is_active())
+        self.assertFalse(self.registry.get("a").get_device_by_id(oven).is_active())
+        # the refreshed snapshot already contains the change
+        self.registry.evict("b")
+        self.assertEqual(21.5, self.registry.get("b").get_device_by_id(oven).state)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import asyncio
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.hub import EventHub
+from fixtures import DatabaseTest
+
+TEMP_SENSOR = "4d8b1d62-7921-4917-9b70-bbd31f6e2e8e"
+PLUG = "1a66c3d6-22b2-446e-bf5c-eb5b9d1a8c79"
+
+class EventHubTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.house = self.repo.load_smarthouse_deep(lazy=True)
+        self.hub = EventHub(self.house, max_lag=0.2, coalesce=0.01)
+        self.repo.add_listener(self.hub.publish)
+
+    def test_events_are_filtered_and_coalesced(self):
+        async def run():
+            await self.hub.start()
+            loop = asyncio.get_running_loop()
+            house = self.hub.subscribe()
+            room = self.hub.subscribe(room_id=self.house.get_device_by_id(TEMP_SENSOR).room.room_id)
+            plug = self.hub.subscribe(device_id=PLUG)
+            # skrivingen skjer på en annen tråd, som i IngestQueue
+            await loop.run_in_executor(None, self.repo.ingest_measurements,
+                                       [(TEMP_SENSOR, f"2024-02-01 10:00:{i:02d}", 20.0 + i, "°C") for i in range(50)])
+            actuator = self.house.get_device_by_id(PLUG)
+            actuator.turn_on()
+            await loop.run_in_executor(None, self.repo.update_actuator_state, actuator)
+            return await house.next(1), await room.next(1), await plug.next(1)
+
+        house, room, plug = asyncio.run(run())
+        self.assertEqual(2, len(house))
+        self.assertEqual([("measurement", TEMP_SENSOR, 69.0, "grader Celsius")],
+                         [(e["type"], e["device"], e["value"], e["unit"]) for e in room])
+        self.assertEqual([{"type": "actuator", "device": PLUG, "room": 6, "state": 1}], plug)
+
+    def test_slow_consumers_are_dropped(self):
+        async def run():
+            await self.hub.start()
+            slow = self.hub.subscribe()
+            self.hub.publish("actuator", [(PLUG, 1)])
+            await asyncio.sleep(0.3)
+            self.hub.publish("actuator", [(PLUG, 0)])
+            await asyncio.sleep(0)
+            return await slow.next(1)
+
+        self.assertIsNone(asyncio.run(run()))
+        self.assertEqual({"subscribers": 0, "published": 2, "delivered": 1, "dropped": 1}, self.hub.metrics())
+
+
+if __name__ == '__main__':
+    unittest.main()
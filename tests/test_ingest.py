@@ -0,0 +1,149 @@
+import unittest
+import asyncio
+from datetime import datetime
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.ingest import IngestQueue
+from fixtures import DatabaseTest
+
+class IngestTest(DatabaseTest):
+
+    def test_ingest_updates_database_memory_and_rollups(self):
+        h = self.repo.load_smarthouse_deep()
+        temp = h.get_device_by_id("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
+        motion = h.get_device_by_id("cd5be4e8-0e6b-4cb5-a21f-819d06cf5fc5")
+        before = len(temp.measurement_history)
+        readings = [(temp, "2024-02-01 10:00:00", 19.5, "°C"),
+                    (temp.id, datetime(2024, 2, 1, 11, 0, 0), 20.5, "°C"),
+                    (motion, "2024-02-01 11:30:00", 1, None)]
+
+        self.assertEqual(3, self.repo.ingest_measurements(readings, house=h))
+
+        # in memory
+        self.assertEqual(before + 2, len(temp.measurement_history))
+        self.assertEqual("2024-02-01 11:00:00", temp.last_measurement().timestamp)
+        self.assertEqual(1.0, motion.last_measurement().value)
+        # persisted
+        reloaded = self.repo.load_smarthouse_deep().get_device_by_id(temp.id)
+        self.assertEqual(before + 2, len(reloaded.measurement_history))
+        # rollups
+        bedroom = h.get_room_by_name("Master Bedroom")
+        self.assertEqual({"2024-02-01": 20.0}, self.repo.calc_avg_temperatures_in_room(bedroom, "2024-02-01", None))
+        self.assertEqual([1, 19.5, 19.5, 19.5], self.repo.hourly_aggregates(bedroom, "°C", "2024-02-01")[10])
+
+    def test_iso_timestamps_are_stored_in_database_format(self):
+        h = self.repo.load_smarthouse_deep(lazy=True)
+        temp = h.get_device_by_id("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
+        self.repo.ingest_measurements([(temp, "2024-01-30T10:15:00", 18.5, "°C")])
+        page, _ = self.repo.get_measurements(temp.id, "2024-01-30", "2024-01-30 23:59:59")
+        self.assertEqual([("2024-01-30 10:15:00", 18.5)], [(m.timestamp, m.value) for m in page])
+        self.assertEqual(["2024-01-30 10:15:00"], [m.timestamp for m in temp.measurements_between("2024-01-30 00:00:00", "2024-01-30 23:59:59")])
+        bedroom = h.get_room_by_name("Master Bedroom")
+        self.assertEqual({"2024-01-30": 18.5}, self.repo.calc_avg_temperatures_in_room(bedroom, "2024-01-30", "2024-01-30"))
+
+    def test_failed_ingest_is_rolled_back(self):
+        h = self.repo.load_smarthouse_deep()
+        temp = h.get_device_by_id("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
+        before = len(temp.measurement_history)
+        with self.assertRaises(ValueError):
+            self.repo.ingest_measurements([(temp, "2024-02-01 10:00:00", 19.5, "°C"),
+                                           (temp, "2024-02-01 11:00:00", "not a number", "°C")], house=h)
+        self.assertEqual(before, len(temp.measurement_history))
+        self.assertEqual(before, len(self.repo.load_smarthouse_deep().get_device_by_id(temp.id).measurement_history))
+
+    def test_queue_group_commits_and_flushes_on_stop(self):
+        h = self.repo.load_smarthouse_deep()
+        temp = h.get_device_by_id("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
+        before = len(temp.measurement_history)
+        queue = IngestQueue(self.repo, h, max_batch=10, max_delay=60, max_pending=25)
+
+        async def produce():
+            await queue.start()
+            accepted = [queue.offer(temp.id, f"2024-02-02 10:{i:02d}:00", 20.0 + i, "°C") for i in range(30)]
+            await asyncio.sleep(0.1)
+            # two full batches have been written, the rest waits for the time limit
+            self.assertEqual(20, queue.metrics()["written"])
+            await queue.stop()
+            return accepted
+
+        accepted = asyncio.run(produce())
+        # backpressure: the buffer holds at most 25 readings
+        self.assertEqual(25, accepted.count(True))
+        metrics = queue.metrics()
+        self.assertEqual(5, metrics["rejected"])
+        self.assertEqual(25, metrics["written"])
+        self.assertEqual(0, metrics["pending"])
+        self.assertEqual(before + 25, len(temp.measurement_history))
+        self.assertEqual(before + 25, len(self.repo.load_smarthouse_deep().get_device_by_id(temp.id).measurement_history))
+
+    def test_queue_sets_aside_readings_that_keep_failing(self):
+        h = self.repo.load_smarthouse_deep()
+        temp = h.get_device_by_id("4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
+        before = len(temp.measurement_history)
+        repo = self.repo
+
+        class PoisonedRepository:
+            # a reading with the value -1 makes every batch it is part of fail
+            def ingest_measurements(self, readings, house):
+                if any(value == -1 for _, _, value, _ in readings):
+                    raise ValueError("poisoned reading")
+                return repo.ingest_measurements(readings, house)
+
+        queue = IngestQueue(PoisonedRepository(), h, max_batch=10, max_delay=0.01, max_attempts=2)
+
+        async def produce():
+            await queue.start()
+            # invalid readings are refused right away
+            with self.assertRaises(ValueError):
+                queue.offer(temp.id, "2024-02-03 10:00:00", "not a number", "°C")
+            with self.assertRaises(ValueError):
+                await queue.put(temp.id, "yesterday", 20.0, "°C")
+            for i in range(10):
+                queue.offer(temp.id, f"2024-02-03 10:{i:02d}:00", -1 if i == 4 else 20.0 + i, "°C")
+            for _ in range(3):
+                await asyncio.sleep(0.05)
+                queue.offer(temp.id, f"2024-02-03 11:{_:02d}:00", 21.0, "°C")
+            await asyncio.sleep(0.05)
+            # ingestion goes on after the bad reading has been set aside
+            self.assertEqual(12, queue.metrics()["written"])
+            await queue.stop()
+
+        with self.assertLogs("smarthouse.ingest", "ERROR") as logs:
+            asyncio.run(produce())
+        self.assertIn("poisoned reading", logs.output[0])
+        metrics = queue.metrics()
+        self.assertEqual(13, metrics["accepted"])
+        self.assertEqual(1, metrics["dropped"])
+        self.assertEqual(0, metrics["pending"])
+        self.assertEqual(0, metrics["retrying"])
+        self.assertEqual(before + 12, len(self.repo.load_smarthouse_deep().get_device_by_id(temp.id).measurement_history))
+
+    def test_queue_drops_failing_retries_on_stop(self):
+        class BrokenRepository:
+            def ingest_measurements(self, readings, house):
+                raise OSError("disk full")
+
+        queue = IngestQueue(BrokenRepository(), max_batch=10, max_delay=0.01, max_pending=3, max_attempts=5)
+
+        async def produce():
+            await queue.start()
+            for i in range(3):
+                queue.offer("d", f"2024-02-03 10:{i:02d}:00", 1.0, None)
+            await asyncio.sleep(0.05)
+            # the readings waiting for a retry still count against max_pending
+            self.assertEqual(3, queue.metrics()["retrying"])
+            self.assertFalse(queue.offer("d", "2024-02-03 10:59:00", 1.0, None))
+            await queue.stop()
+
+        with self.assertLogs("smarthouse.ingest", "ERROR") as logs:
+            asyncio.run(produce())
+        self.assertEqual(3, len(logs.output))
+        self.assertEqual(3, queue.metrics()["dropped"])
+        self.assertEqual(0, queue.metrics()["pending"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import tracemalloc
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.domain import SmartHouse, Sensor, Aktuator, Measurement
+
+# upper bounds for the memory footprint, raise them only on purpose
+MAX_BYTES_PER_DEVICE = 1500
+MAX_BYTES_PER_MEASUREMENT = 32
+
+
+def build_house(floors, rooms_per_floor, devices_per_room):
+    house = SmartHouse()
+    for level in range(1, floors + 1):
+        floor = house.register_floor(level)
+        for r in range(rooms_per_floor):
+            room = house.register_room(floor, 10.0, f"Room {level}.{r}")
+            for d in range(devices_per_room):
+                device_id = f"{level}-{r}-{d}"
+                if d % 2:
+                    house.register_device(room, Aktuator(device_id, "Acme", "A1", "Smart Plug"))
+                else:
+                    house.register_device(room, Sensor(device_id, "Acme", "T1", "Temperature Sensor"))
+    return house
+
+
+class MemoryBenchmark(unittest.TestCase):
+    """
+    Measures how many bytes the domain model needs per device and per measurement
+    for a synthetic house and fails if the numbers regress past the limits above.
+    """
+
+    def test_bytes_per_device_and_measurement(self):
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            house = build_house(floors=4, rooms_per_floor=25, devices_per_room=10)
+            after_structure = tracemalloc.get_traced_memory()[0]
+
+            devices = house.get_devices()
+            per_device = 200
+            for device in devices:
+                for i in range(per_device):
+                    device.add_measurement_known(Measurement(1706313600 + 60 * i, 20.0 + i % 7, "°C"))
+            after_measurements = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+
+        bytes_per_device = (after_structure - before) / len(devices)
+        bytes_per_measurement = (after_measurements - after_structure) / (len(devices) * per_device)
+        print(f"\n{len(devices)} devices: {bytes_per_device:.0f} bytes/device, "
+              f"{bytes_per_measurement:.1f} bytes/measurement")
+
+        self.assertLess(bytes_per_device, MAX_BYTES_PER_DEVICE)
+        self.assertLess(bytes_per_measurement, MAX_BYTES_PER_MEASUREMENT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+import asyncio
+import sqlite3
+
+from pathlib import Path
+import sys
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.metrics import Histogram, Metrics, MetricsMiddleware, TracingCursor
+from fixtures import DatabaseTest
+
+class MetricsTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.metrics = Metrics()
+
+    def test_histogram_buckets(self):
+        h = Histogram((0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            h.observe(value)
+        self.assertEqual([2, 1, 1], h.counts)
+        self.assertEqual(4, h.count)
+        self.assertAlmostEqual(3.65, h.sum)
+
+    def test_traced_statements(self):
+        self.repo.trace(self.metrics)
+        h = self.repo.load_smarthouse_deep()
+        humidity = h.get_device_by_id("3d87e5c0-8716-4b0b-9c67-087eaaed7b45")
+        oven = h.get_device_by_id("8d4e4c98-21a9-4d1e-bf18-523285ad90f6")
+        page, _ = self.repo.get_measurements(humidity.id, limit=10)
+        self.repo.update_actuator_state(oven)
+
+        rows = self.metrics.rows
+        load = "SELECT device, CAST(strftime('%s', ts) AS INTEGER), value, unit, ts FROM measurements WHERE rowid <= ?"
+        self.assertEqual(sum(len(d.measurement_history) for d in h.get_devices()), rows[load])
+        self.assertEqual(11, rows["SELECT rowid, ts, value, unit FROM measurements WHERE device = ? ORDER BY ts, rowid LIMIT ?"])
+        self.assertEqual(1, rows["UPDATE ActuatorState SET state = ? WHERE id = ?;"])
+        self.assertEqual(1, self.metrics.statements[load].count)
+
+        text = self.metrics.render({"smarthouse_test": 3})
+        self.assertIn('smarthouse_sql_statement_rows_total{statement="UPDATE ActuatorState SET state = ? WHERE id = ?;"} 1', text)
+        self.assertIn('smarthouse_sql_statement_duration_seconds_bucket{statement="BEGIN",le="+Inf"}', text)
+        self.assertIn("smarthouse_test 3", text)
+
+        # untraced again
+        self.repo.trace(None)
+        with self.repo.read_cursor() as cursor:
+            self.assertIs(sqlite3.Cursor, type(cursor))
+        # switched off
+        self.repo.trace(self.metrics)
+        self.metrics.enabled = False
+        with self.repo.read_cursor() as cursor:
+            self.assertNotIsInstance(cursor, TracingCursor)
+
+    def test_middleware_uses_route_template(self):
+        class Route:
+            path = "/smarthouse/device/{uuid}"
+
+        async def app(scope, receive, send):
+            scope["route"] = Route()
+            await send({"type": "http.response.start", "status": 404})
+            await send({"type": "http.response.body", "body": b""})
+
+        async def send(message):
+            pass
+
+        middleware = MetricsMiddleware(app, self.metrics)
+        for _ in range(3):
+            asyncio.run(middleware({"type": "http", "method": "GET"}, None, send))
+        self.assertEqual(3, self.metrics.requests[("GET", "/smarthouse/device/{uuid}", 404)].count)
+        self.assertIn('route="/smarthouse/device/{uuid}",status="404",le="0.0005"}', self.metrics.render())
+
+        self.metrics.enabled = False
+        asyncio.run(middleware({"type": "http", "method": "GET"}, None, send))
+        self.assertEqual(3, self.metrics.requests[("GET", "/smarthouse/device/{uuid}", 404)].count)
+
+
+if __name__ == '__main__':
+    unittest.main()
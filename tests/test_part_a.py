@@ -4,7 +4,7 @@ from pathlib import Path
 import sys 
 sys.path.append(str(Path().parent.absolute()))
 
-from smarthouse.domain import SmartHouse
+from smarthouse.domain import SmartHouse, Sensor, Measurement, to_epoch, from_epoch
 from demo_house import DEMO_HOUSE as h
 
 class TestPartA(TestCase):
@@ -29,6 +29,44 @@ class TestPartA(TestCase):
         self.assertEqual(l.id, "4d8b1d62-7921-4917-9b70-bbd31f6e2e8e")
         self.assertTrue(l in h.get_devices())
 
+    def test_basic_lookup_indexes(self):
+        house = SmartHouse()
+        floor = house.register_floor(1)
+        kitchen = house.register_room(floor, 20, "Kitchen", 1)
+        hall = house.register_room(floor, 5, "Hall", 2)
+        sensor = house.register_device(kitchen, Sensor("s-1", "Acme", "T1", "Temperature Sensor"))
+        self.assertIs(house.get_floor(1), floor)
+        self.assertIs(house.get_room_by_name("Hall"), hall)
+        self.assertIs(house.get_room_by_id(1), kitchen)
+        self.assertIs(house.get_device_by_id("s-1"), sensor)
+        # moving keeps the device registered, removing it drops it from the house
+        house.register_device(hall, sensor)
+        self.assertIs(house.get_device_by_id("s-1"), sensor)
+        hall.remove_device(sensor)
+        self.assertIsNone(house.get_device_by_id("s-1"))
+        self.assertEqual(len(house.get_devices()), 0)
+
+    def test_basic_cached_aggregates(self):
+        house = SmartHouse()
+        floor = house.register_floor(1)
+        kitchen = house.register_room(floor, 20, "Kitchen", 1)
+        self.assertEqual(house.get_area(), 20)
+        version = house.version
+        hall = house.register_room(floor, 5, "Hall", 2)
+        self.assertEqual((floor.get_area(), house.get_area(), house.get_room_count()), (25, 25, 2))
+        kitchen.area = 30
+        self.assertEqual((floor.get_area(), house.get_area()), (35, 35))
+        sensor = house.register_device(hall, Sensor("s-1", "Acme", "T1", "Temperature Sensor"))
+        self.assertEqual(house.get_device_count(), 1)
+        hall.remove_device(sensor)
+        self.assertEqual(house.get_device_count(), 0)
+        upstairs = house.register_floor(2)
+        house.update_room(hall, upstairs, 5, "Hall")
+        self.assertEqual((floor.get_area(), upstairs.get_area(), house.get_area()), (30, 5, 35))
+        house.remove_room(kitchen)
+        self.assertEqual((house.get_area(), house.get_room_count()), (5, 1))
+        self.assertGreater(house.version, version)
+
 
     # Level 2 Intermediate: Testing the attributes and methods of device object
 
@@ -59,6 +97,40 @@ class TestPartA(TestCase):
         self.assertEqual(m.unit, "°C")
         self.assertEqual(type(m.value), type(0.0))
 
+    def test_intermediate_measurement_series(self):
+        sensor = Sensor("s-2", "Acme", "H1", "Humidity Sensor")
+        sensor.add_measurement_known(Measurement("2024-01-27 07:00:00", 55.5, "%"))
+        sensor.add_measurement_known(Measurement("2024-01-27 08:00:00", 56, "%"))
+        history = sensor.measurement_history
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.units, ["%"])
+        self.assertEqual(history[0].timestamp, "2024-01-27 07:00:00")
+        self.assertEqual([m.value for m in history], [55.5, 56.0])
+        self.assertEqual(sensor.last_measurement().timestamp, "2024-01-27 08:00:00")
+
+    def test_intermediate_measurement_ranges(self):
+        sensor = Sensor("s-3", "Acme", "T1", "Temperature Sensor")
+        for hour in (7, 8, 10, 11):
+            sensor.add_measurement_known(Measurement(f"2024-01-27 {hour:02d}:00:00", float(hour), "°C"))
+        # late readings are put in their place
+        sensor.add_measurement_known(Measurement("2024-01-27 09:00:00", 9.0, "°C"))
+        sensor.add_measurement_known(Measurement("2024-01-27 06:30:00", 6.5, "°C"))
+        history = sensor.measurement_history
+        self.assertEqual([6.5, 7.0, 8.0, 9.0, 10.0, 11.0], [m.value for m in history])
+        self.assertEqual("2024-01-27 11:00:00", sensor.last_measurement().timestamp)
+
+        self.assertEqual([8.0, 9.0, 10.0], [m.value for m in sensor.measurements_between("2024-01-27 08:00:00", "2024-01-27 10:00:00")])
+        self.assertEqual([6.5, 7.0], [m.value for m in sensor.measurements_between(None, "2024-01-27 07:59:59")])
+        self.assertEqual([], sensor.measurements_between("2024-01-27 12:00:00", None))
+        self.assertEqual([], sensor.measurements_between("2024-01-27 10:00:00", "2024-01-27 08:00:00"))
+        self.assertEqual(9.0, sensor.measurement_at("2024-01-27 09:59:59").value)
+        self.assertEqual(9.0, sensor.measurement_at("2024-01-27 09:00:00").value)
+        self.assertIsNone(sensor.measurement_at("2024-01-27 06:00:00"))
+        self.assertEqual([9.0, 10.0], [m.value for m in sensor.measurements_window("2024-01-27 10:30:00", 5400)])
+        # timestamps keep the database format, also for years before 1000
+        for timestamp in ("2024-01-27 09:05:03", "0999-05-01 00:00:00"):
+            self.assertEqual(timestamp, from_epoch(to_epoch(timestamp)))
+
     def test_intermediate_actuator_state_change(self):
         # actuators can be turned on and off
         bulp = h.get_device_by_id("6b1c5f6b-37f6-4e3d-9145-1cfbe2f1fc28")
@@ -4,11 +4,9 @@ from pathlib import Path
 import sys 
 sys.path.append(str(Path().parent.absolute()))
 
-from smarthouse.persistence import SmartHouseRepository
+from fixtures import SharedDatabaseTest
 
-class SmartHouseTest(unittest.TestCase):
-    file = Path(__file__).parent / "../data/db.sql"
-    repo = SmartHouseRepository(file)
+class SmartHouseTest(SharedDatabaseTest):
 
     def test_cursor(self):
         c = self.repo.cursor()
@@ -49,6 +47,56 @@ class SmartHouseTest(unittest.TestCase):
         self.assertEqual(55.2125, self.repo.get_latest_reading(humidity_sensor).value)
         self.assertEqual('2024-01-29 16:00:01', self.repo.get_latest_reading(humidity_sensor).timestamp)
 
+    def test_basic_read_values_lazy(self):
+        h = self.repo.load_smarthouse_deep(lazy=True)
+        amp_sensor = h.get_device_by_id("a2f8690f-2b3a-43cd-90b8-9deea98b42a7")
+        motion_sensor = h.get_device_by_id("cd5be4e8-0e6b-4cb5-a21f-819d06cf5fc5")
+        self.assertEqual(13.7, self.repo.get_latest_reading(amp_sensor).value)
+        self.assertEqual('2024-01-28 23:00:00', self.repo.get_latest_reading(amp_sensor).timestamp)
+        self.assertEqual(None, self.repo.get_latest_reading(motion_sensor))
+        # the lazy history pages through the same rows as the eager one
+        eager = self.repo.load_smarthouse_deep().get_device_by_id(amp_sensor.id).measurement_history
+        history = amp_sensor.measurement_history
+        self.assertEqual(len(eager), len(history))
+        self.assertEqual([m.timestamp for m in eager], [m.timestamp for m in history])
+        self.assertEqual([m.value for m in eager[2:5]], [m.value for m in history[2:5]])
+        for index in (slice(None, None, -1), slice(5, 1, -2), slice(None, None, 3), slice(1, 2, -1)):
+            self.assertEqual([m.timestamp for m in eager[index]], [m.timestamp for m in history[index]])
+        self.assertEqual(eager[0].value, history[0].value)
+
+    def test_basic_read_values_ranges(self):
+        humidity_sensor = "3d87e5c0-8716-4b0b-9c67-087eaaed7b45"
+        eager = self.repo.load_smarthouse_deep().get_device_by_id(humidity_sensor)
+        lazy = self.repo.load_smarthouse_deep(lazy=True).get_device_by_id(humidity_sensor)
+        day = [m.timestamp for m in eager.measurement_history if m.timestamp.startswith("2024-01-27")]
+        for device in (eager, lazy):
+            self.assertEqual(day, [m.timestamp for m in device.measurements_between("2024-01-27 00:00:00", "2024-01-27 23:59:59")])
+            self.assertEqual(day[-1], device.measurement_at("2024-01-27 23:59:59").timestamp)
+            self.assertEqual(day[:1], [m.timestamp for m in device.measurements_window(day[0], 0)])
+            self.assertEqual(55.2125, device.measurement_at("2030-01-01 00:00:00").value)
+            self.assertIsNone(device.measurement_at("2000-01-01 00:00:00"))
+
+    def test_basic_read_values_paged(self):
+        humidity_sensor = "3d87e5c0-8716-4b0b-9c67-087eaaed7b45"
+        history = self.repo.load_smarthouse_deep(lazy=True).get_device_by_id(humidity_sensor).measurement_history
+        pages = []
+        after = None
+        while True:
+            page, after = self.repo.get_measurements(humidity_sensor, "2024-01-27 00:00:00", "2024-01-27 23:59:59", 500, after)
+            pages.append(page)
+            if after is None:
+                break
+        day = [m for m in history if m.timestamp.startswith("2024-01-27")]
+        self.assertEqual(len(day) // 500 + 1, len(pages))
+        self.assertEqual([m.timestamp for m in day], [m.timestamp for page in pages for m in page])
+        # downsampled to hourly buckets, also in pages
+        buckets, after = self.repo.get_measurement_buckets(humidity_sensor, 3600, "2024-01-27 00:00:00", "2024-01-27 23:59:59", 10)
+        rest, last = self.repo.get_measurement_buckets(humidity_sensor, 3600, "2024-01-27 00:00:00", "2024-01-27 23:59:59", 10, after)
+        self.assertIsNone(last)
+        self.assertEqual(len(day), sum(bucket[1] for bucket in buckets + rest))
+        self.assertEqual("2024-01-27 06:00:00", buckets[0][0])
+        self.assertAlmostEqual(sum(m.value for m in day if m.timestamp[11:13] == "06") / buckets[0][1], buckets[0][2])
+
 
     def test_intermediate_save_actuator_state(self):
         h = self.repo.load_smarthouse_deep()
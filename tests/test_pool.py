@@ -0,0 +1,73 @@
+import unittest
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from fixtures import DatabaseTest
+
+class ConnectionPoolTest(DatabaseTest):
+    readers = 3
+
+    def test_cursors_are_closed_and_readers_are_read_only(self):
+        with self.repo.read_cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM rooms")
+            self.assertEqual(12, cursor.fetchone()[0])
+            with self.assertRaises(sqlite3.OperationalError):
+                cursor.execute("DELETE FROM rooms")
+        with self.assertRaises(sqlite3.ProgrammingError):
+            cursor.execute("SELECT 1")
+
+    def test_concurrent_reads_during_writes(self):
+        h = self.repo.load_smarthouse_deep(lazy=True)
+        humidity = h.get_device_by_id("3d87e5c0-8716-4b0b-9c67-087eaaed7b45")
+        bath = h.get_room_by_name("Bathroom 1")
+        start_count = len(humidity.measurement_history)
+        errors = []
+        reads = []
+        done = threading.Event()
+
+        def reader():
+            try:
+                last_seen = start_count
+                while not done.is_set():
+                    count = len(humidity.measurement_history)
+                    # writes become visible in whole transactions and never disappear
+                    self.assertGreaterEqual(count, last_seen)
+                    self.assertEqual(0, (count - start_count) % 50)
+                    last_seen = count
+                    self.assertIsNotNone(humidity.last_measurement())
+                    self.repo.calc_hours_with_humidity_above(bath, '2024-01-27')
+                    reads.append(count)
+            except Exception as e:
+                errors.append(e)
+
+        def writer():
+            try:
+                for batch in range(10):
+                    self.repo.ingest_measurements(
+                        [(humidity.id, f"2024-02-{batch + 1:02d} 10:{i:02d}:00", 50.0, "%") for i in range(50)])
+                    time.sleep(0.01)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                done.set()
+
+        threads = [threading.Thread(target=reader) for _ in range(8)] + [threading.Thread(target=writer)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=60)
+
+        self.assertEqual([], errors)
+        self.assertTrue(reads)
+        self.assertEqual(start_count + 500, len(humidity.measurement_history))
+        # eight threads shared at most three read connections
+        self.assertLessEqual(len(self.repo.pool.readers), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
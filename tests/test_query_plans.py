@@ -0,0 +1,82 @@
+import unittest
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.persistence import MIGRATIONS
+from fixtures import SharedDatabaseTest
+
+
+class QueryPlanTest(SharedDatabaseTest):
+    """
+    Records the SQL statements issued by the hot path methods of the repository
+    and checks with EXPLAIN QUERY PLAN that none of them scans a whole table.
+    """
+
+    def record_statements(self, action):
+        statements = []
+        # make sure a read connection exists, then trace every connection of the pool
+        with self.repo.read_cursor():
+            pass
+        connections = self.repo.pool.connections()
+        for conn in connections:
+            conn.set_trace_callback(statements.append)
+        try:
+            action()
+        finally:
+            for conn in connections:
+                conn.set_trace_callback(None)
+        return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+    def assert_no_full_scans(self, statements):
+        self.assertTrue(statements)
+        for sql in statements:
+            plan = self.repo.conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+            scans = [row[3] for row in plan if row[3].startswith("SCAN") and row[3] != "SCAN CONSTANT ROW"]
+            self.assertEqual([], scans, sql)
+
+    def test_schema_is_migrated(self):
+        self.assertEqual(len(MIGRATIONS), self.repo.schema_version())
+
+    def test_statistics_use_indexes(self):
+        h = self.repo.load_smarthouse_deep(lazy=True)
+        bedroom = h.get_room_by_name("Master Bedroom")
+        bath = h.get_room_by_name("Bathroom 1")
+        statements = self.record_statements(lambda: (
+            self.repo.calc_avg_temperatures_in_room(bedroom, '2024-01-27', None),
+            self.repo.calc_avg_temperatures_in_room(bedroom, None, None),
+            self.repo.calc_hours_with_humidity_above(bath, '2024-01-27'),
+        ))
+        self.assert_no_full_scans(statements)
+
+    def test_lazy_history_uses_indexes(self):
+        h = self.repo.load_smarthouse_deep(lazy=True)
+        humidity_sensor = h.get_device_by_id("3d87e5c0-8716-4b0b-9c67-087eaaed7b45")
+        statements = self.record_statements(lambda: (
+            humidity_sensor.last_measurement(),
+            len(humidity_sensor.measurement_history),
+            humidity_sensor.measurement_history[10:20],
+        ))
+        self.assert_no_full_scans(statements)
+        # the latest reading is looked up with a single query
+        self.assertEqual(1, sum("ORDER BY ts DESC" in statement for statement in statements))
+
+    def test_sync_uses_indexes(self):
+        h = self.repo.load_smarthouse_deep()
+        h.synced_seq = 0
+        h.synced_rowid -= 10
+        statements = self.record_statements(lambda: self.repo.fetch_changes(h))
+        self.assert_no_full_scans(statements)
+
+    def test_paged_values_use_indexes(self):
+        device = "3d87e5c0-8716-4b0b-9c67-087eaaed7b45"
+        statements = self.record_statements(lambda: (
+            self.repo.get_measurements(device, "2024-01-27 00:00:00", None, 100, ("2024-01-27 10:00:00", 1)),
+            self.repo.get_measurement_buckets(device, 3600, None, "2024-01-28 23:59:59", 10, 1706349600),
+        ))
+        self.assert_no_full_scans(statements)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from fixtures import DatabaseTest
+
+class RollupTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.house = self.repo.load_smarthouse_deep(lazy=True)
+        self.bedroom = self.house.get_room_by_name("Master Bedroom")
+
+    def raw_daily(self, start, end):
+        c = self.repo.cursor()
+        c.execute("""
+                  SELECT substr(m.ts, 1, 10), COUNT(*), SUM(m.value), MIN(m.value), MAX(m.value)
+                  FROM devices d INNER JOIN measurements m ON d.id = m.device
+                  WHERE m.unit = '°C' AND d.room = 12 AND m.ts >= ? AND m.ts <= ?
+                  GROUP BY 1
+                  """, (start, end))
+        result = {row[0]: list(row[1:]) for row in c.fetchall()}
+        c.close()
+        return result
+
+    def assert_same(self, expected, actual):
+        self.assertEqual(expected.keys(), actual.keys())
+        for day in expected:
+            self.assertEqual(expected[day][0], actual[day][0])
+            for e, a in zip(expected[day][1:], actual[day][1:]):
+                self.assertAlmostEqual(e, a, 6)
+
+    def test_rollups_match_raw_data_with_edges(self):
+        for start, end in [("2024-01-27 00:00:00", "2024-01-28 23:59:59"),
+                           ("2024-01-27 10:30:00", "2024-01-28 09:15:00"),
+                           ("2024-01-27 10:30:00", "2024-01-27 18:00:00"),
+                           ("2024-01-27 00:00:00", "2024-01-27 18:00:00")]:
+            self.assert_same(self.raw_daily(start, end), self.repo.daily_aggregates(self.bedroom, '°C', start, end))
+
+    def test_rollups_follow_inserts_and_rebuilds(self):
+        c = self.repo.cursor()
+        c.execute("INSERT INTO measurements VALUES ('4d8b1d62-7921-4917-9b70-bbd31f6e2e8e', '2024-01-28 10:15:00', 40.0, '°C')")
+        self.repo.conn.commit()
+        hourly = self.repo.hourly_aggregates(self.bedroom, '°C', '2024-01-28')
+        self.assertEqual(40.0, hourly[10][3])
+        self.assert_same(self.raw_daily("2024-01-28 00:00:00", "2024-01-28 23:59:59"),
+                         self.repo.daily_aggregates(self.bedroom, '°C', "2024-01-28 00:00:00", "2024-01-28 23:59:59"))
+
+        c.execute("DELETE FROM measurements WHERE ts = '2024-01-28 10:15:00'")
+        self.repo.conn.commit()
+        c.close()
+        self.repo.rebuild_rollups('4d8b1d62-7921-4917-9b70-bbd31f6e2e8e')
+        self.assertNotEqual(40.0, self.repo.hourly_aggregates(self.bedroom, '°C', '2024-01-28')[10][3])
+        self.assert_same(self.raw_daily("2024-01-28 00:00:00", "2024-01-28 23:59:59"),
+                         self.repo.daily_aggregates(self.bedroom, '°C', "2024-01-28 00:00:00", "2024-01-28 23:59:59"))
+
+
+if __name__ == '__main__':
+    unittest.main()
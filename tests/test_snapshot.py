@@ -0,0 +1,72 @@
+import unittest
+import sqlite3
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from fixtures import DatabaseTest
+
+TEMP_SENSOR = "4d8b1d62-7921-4917-9b70-bbd31f6e2e8e"
+
+def contents(house):
+    return (
+        house.name, house.synced_seq, house.synced_rowid,
+        [(floor.level, [(room.room_id, room.room_name, room.area) for room in floor.rooms]) for floor in house.get_floors()],
+        [(d.id, d.room.room_id, d.supplier, d.model_name, d.device_type, d.category, getattr(d, "state", None),
+          [(m.timestamp, m.value, m.unit) for m in d.measurement_history]) for d in house.get_devices()],
+    )
+
+class SnapshotTest(DatabaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.path = Path(self.repo.snapshot_path())
+
+    def test_roundtrip(self):
+        self.assertIsNone(self.repo.load_snapshot())
+        house = self.repo.load_smarthouse_cached()
+        self.assertTrue(self.path.exists())
+
+        cached = self.repo.load_snapshot()
+        self.assertEqual(contents(self.repo.load_smarthouse_deep()), contents(cached))
+        self.assertEqual(contents(house), contents(cached))
+        # lazy reads only the structure
+        lazy = self.repo.load_snapshot(lazy=True)
+        self.assertEqual(len(house.get_device_by_id(TEMP_SENSOR).measurement_history),
+                         len(lazy.get_device_by_id(TEMP_SENSOR).measurement_history))
+
+    def test_stale_snapshot_is_brought_up_to_date(self):
+        self.repo.load_smarthouse_cached()
+        conn = sqlite3.connect(self.file)
+        with conn:
+            conn.execute("INSERT INTO measurements VALUES (?, '2024-02-01 10:00:00', 21.0, '°C')", (TEMP_SENSOR,))
+            conn.execute("UPDATE rooms SET area = 50 WHERE id = 1")
+        conn.close()
+        house = self.repo.load_smarthouse_cached()
+        self.assertEqual(contents(self.repo.load_smarthouse_deep()), contents(house))
+        self.assertEqual(50, house.get_room_by_id(1).area)
+        # snapshotet er skrevet på nytt og er nå oppdatert
+        self.assertEqual(contents(house), contents(self.repo.load_snapshot()))
+
+    def test_unusable_snapshots_fall_back_to_sql(self):
+        self.repo.load_smarthouse_cached(lazy=True)
+        # uten målinger kan det ikke brukes for et fullt hus
+        self.assertIsNone(self.repo.load_snapshot())
+        self.repo.load_smarthouse_cached()
+        data = self.path.read_bytes()
+        self.path.write_bytes(data[:-10])
+        self.assertIsNone(self.repo.load_snapshot())
+        # avkortet midt i et element av en kolonne
+        self.path.write_bytes(data[:-3])
+        self.assertIsNone(self.repo.load_snapshot())
+        self.assertEqual(12, len(self.repo.load_smarthouse_cached().get_rooms()))
+        self.path.write_bytes(data.replace(b'"floors":[[', b'"floors":[["x",', 1))
+        self.assertIsNone(self.repo.load_snapshot())
+        self.path.write_bytes(b"garbage")
+        self.assertIsNone(self.repo.load_snapshot())
+        self.assertEqual(contents(self.repo.load_smarthouse_deep()), contents(self.repo.load_smarthouse_cached()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import asyncio
+import sqlite3
+
+from pathlib import Path
+import sys 
+sys.path.append(str(Path().parent.absolute()))
+
+from smarthouse.sync import HouseSync
+from fixtures import DatabaseTest
+
+TEMP_SENSOR = "4d8b1d62-7921-4917-9b70-bbd31f6e2e8e"
+PLUG = "1a66c3d6-22b2-446e-bf5c-eb5b9d1a8c79"
+
+def snapshot(house):
+    return (
+        [(floor.level, [(room.room_id, room.room_name, room.area, sorted(d.id for d in room.devices)) for room in floor.rooms])
+         for floor in house.get_floors()],
+        sorted((d.id, d.room.room_id, d.supplier, d.model_name, d.device_type, getattr(d, "state", None),
+                len(d.measurement_history)) for d in house.get_devices()),
+    )
+
+class HouseSyncTest(DatabaseTest):
+
+    def write(self, *statements):
+        # en annen prosess som endrer databasen
+        conn = sqlite3.connect(self.file)
+        with conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+        conn.close()
+
+    def test_sync_matches_full_reload(self):
+        for lazy in (False, True):
+            h = self.repo.load_smarthouse_deep(lazy=lazy)
+            self.write(
+                ("INSERT INTO rooms VALUES (?, ?, ?, ?)", (100 + lazy, 3, 12.5, f"Attic {lazy}")),
+                ("INSERT INTO devices VALUES (?, ?, ?, ?, ?, ?)", (f"new-{lazy}", 100 + lazy, "Light Bulp", "actuator", "Acme", "L1")),
+                ("INSERT INTO ActuatorState VALUES (?, ?)", (f"new-{lazy}", 1)),
+                ("INSERT INTO measurements VALUES (?, ?, ?, ?)", (f"new-{lazy}", "2024-02-01 10:00:00", 1.0, None)),
+                ("INSERT INTO measurements VALUES (?, ?, ?, ?)", (TEMP_SENSOR, "2024-02-01 10:00:00", 21.0, "°C")),
+                ("UPDATE ActuatorState SET state = ? WHERE id = ?", (1 - lazy, PLUG)),
+                ("UPDATE devices SET room = ? WHERE id = ?", (100 + lazy, TEMP_SENSOR)),
+                ("UPDATE rooms SET name = ?, area = ? WHERE id = ?", (f"Office {lazy}", 10.0, 1)),
+            )
+            before = h.get_device_by_id(TEMP_SENSOR)
+
+            changes = self.repo.fetch_changes(h, lazy)
+            self.repo.apply_changes(h, changes, lazy)
+
+            self.assertEqual(snapshot(self.repo.load_smarthouse_deep(lazy=lazy)), snapshot(h))
+            # objektene beholdes og oppdateres på stedet
+            self.assertIs(before, h.get_device_by_id(TEMP_SENSOR))
+            self.assertEqual(3, h.get_device_by_id(TEMP_SENSOR).room.floor.level)
+            self.assertIsNone(h.get_room_by_name("Living Room / Kitchen"))
+
+    def test_removed_rooms_and_devices(self):
+        h = self.repo.load_smarthouse_deep()
+        room = h.get_room_by_id(12)
+        self.write(("DELETE FROM measurements WHERE device IN (SELECT id FROM devices WHERE room = 12)", ()),
+                   ("DELETE FROM ActuatorState WHERE id IN (SELECT id FROM devices WHERE room = 12)", ()),
+                   ("DELETE FROM devices WHERE room = 12", ()),
+                   ("DELETE FROM rooms WHERE id = 12", ()))
+        self.repo.apply_changes(h, self.repo.fetch_changes(h))
+        self.assertEqual(snapshot(self.repo.load_smarthouse_deep()), snapshot(h))
+        self.assertNotIn(room, h.get_rooms())
+
+    def test_sync_and_ingest_do_not_duplicate(self):
+        h = self.repo.load_smarthouse_deep()
+        history = h.get_device_by_id(TEMP_SENSOR).measurement_history
+        before = len(history)
+        self.repo.ingest_measurements([(TEMP_SENSOR, "2024-02-01 10:00:00", 20.0, "°C")], house=h)
+        self.write(("INSERT INTO measurements VALUES (?, ?, ?, ?)", (TEMP_SENSOR, "2024-02-01 11:00:00", 21.0, "°C")))
+        # huset mangler nå en rad, så denne overlates til synkroniseringen
+        self.repo.ingest_measurements([(TEMP_SENSOR, "2024-02-01 12:00:00", 22.0, "°C")], house=h)
+        self.assertEqual(before + 1, len(history))
+
+        changes = asyncio.run(HouseSync(self.repo, h).sync())
+        self.assertEqual(2, len(changes["measurements"]))
+        self.assertEqual(before + 3, len(history))
+        self.assertEqual([20.0, 21.0, 22.0], [m.value for m in history[-3:]])
+        self.repo.apply_changes(h, self.repo.fetch_changes(h))
+        self.assertEqual(before + 3, len(history))
+
+
+if __name__ == '__main__':
+    unittest.main()